@@ -0,0 +1,77 @@
+import asyncio
+import functools
+from contextvars import ContextVar
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+in_async_view = ContextVar('in_async_view', default=False)
+
+
+def database_sync_to_async(func):
+    """Выполняет func в потоке из общего пула со своим соединением
+    с базой и закрывает соединение по правилам CONN_MAX_AGE."""
+
+    def inner(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(inner, thread_sensitive=False)
+
+
+def concurrently(*funcs):
+    """Вызывает независимые функции, обращающиеся к базе, и возвращает
+    их результаты по порядку.
+
+    В асинхронном представлении функции выполняются одновременно
+    в разных потоках и соединениях, иначе — последовательно.
+    Вложенный вызов выполняется последовательно: иначе поток пула
+    ждал бы освобождения потоков того же пула.
+    """
+    if not in_async_view.get():
+        return [func() for func in funcs]
+
+    async def gather():
+        return await asyncio.gather(
+            *(database_sync_to_async(func)() for func in funcs)
+        )
+
+    token = in_async_view.set(False)
+    try:
+        return async_to_sync(gather)()
+    finally:
+        in_async_view.reset(token)
+
+
+def as_async_view(view):
+    """Асинхронная обёртка синхронного представления DRF.
+
+    Обработчик выполняется в потоке запроса, а concurrently() внутри него
+    распределяет запросы к базе по пулу потоков.
+    """
+    sync_view = sync_to_async(view)
+
+    @functools.wraps(view)
+    async def async_view(request, *args, **kwargs):
+        token = in_async_view.set(True)
+        try:
+            return await sync_view(request, *args, **kwargs)
+        finally:
+            in_async_view.reset(token)
+
+    return async_view
+
+
+class AsyncViewSetMixin:
+    """Под ASGI (настройка ASGI) регистрирует маршруты вьюсета
+    как асинхронные представления."""
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        view = super().as_view(actions, **initkwargs)
+        if settings.ASGI:
+            return as_async_view(view)
+        return view
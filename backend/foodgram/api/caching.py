@@ -0,0 +1,131 @@
+from hashlib import md5
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from . import versions
+from .metrics import record_cache
+
+
+def get_request_signature(request, tables):
+    """Хэш хоста, пути, нормализованной строки запроса и версий таблиц
+    или строк tables."""
+    query = urlencode(sorted(
+        (key, sorted(values))
+        for key, values in request.query_params.lists()
+    ), doseq=True)
+    table_versions = versions.get_versions(tables)
+    signature = repr(
+        (request.get_host(), request.path, query, table_versions)
+    )
+    return md5(signature.encode()).hexdigest(), table_versions
+
+
+def tables_of(models):
+    return sorted(model._meta.db_table for model in models)
+
+
+class VersionedCacheMixin:
+    """Версии, от которых зависят кэшируемые ответы представления."""
+    cache_models = ()
+
+    def get_cache_versions(self):
+        """Таблицы cache_models; представление может сузить их до строк,
+        которые попадают в ответ, см. versions.row()."""
+        return tables_of(self.cache_models)
+
+
+class ConditionalGetMixin(VersionedCacheMixin):
+    """Отвечает 304 на list и retrieve, если данные не менялись.
+
+    ETag и Last-Modified вычисляются по get_cache_versions() (и версиям
+    таблиц user_cache_models для авторизованных) до сериализации ответа.
+    Анонимные ответы помечаются как публичные, чтобы nginx мог их
+    кэшировать, авторизованные — как приватные с Vary: Authorization.
+    """
+    user_cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        user = request.user
+        tables = self.get_cache_versions()
+        if user.is_authenticated:
+            tables += tables_of(self.user_cache_models)
+        signature, table_versions = get_request_signature(request, tables)
+        etag = f'"{signature}-{user.pk or 0}"'
+        last_modified = int(max(table_versions, default=0))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        record_cache(
+            'conditional', self.basename, 'miss' if response is None else 'hit'
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        if user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(
+                response, public=True, max_age=settings.HTTP_CACHE_MAX_AGE
+            )
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+
+class AnonymousResponseCacheMixin(VersionedCacheMixin):
+    """Кэширует ответы list и retrieve для анонимных пользователей.
+
+    Ключ строится по пути, нормализованной строке запроса и версиям
+    get_cache_versions(), поэтому запись в эти таблицы или строки делает
+    сохранённые ответы недоступными. Попадания и промахи считаются
+    в foodgram_cache_requests_total{cache="response"}.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_response_cache_key(self, request):
+        signature, _ = get_request_signature(
+            request, self.get_cache_versions()
+        )
+        return 'response:' + signature
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            record_cache('response', self.basename, 'hit')
+            return Response(data)
+        record_cache('response', self.basename, 'miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
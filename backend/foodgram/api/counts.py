@@ -0,0 +1,54 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+from . import versions
+from .metrics import record_cache
+
+
+def estimate_count(queryset):
+    """Оценка числа строк таблицы по статистике планировщика PostgreSQL."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def get_count(queryset):
+    """Возвращает пару (count, is_exact) для queryset.
+
+    Для таблицы без фильтров больше COUNT_ESTIMATE_THRESHOLD строк
+    используется оценка планировщика. Точные значения кэшируются по SQL
+    запроса и версиям задействованных таблиц на COUNT_CACHE_TIMEOUT секунд.
+    """
+    query = queryset.query
+    if not query.where and not query.distinct and not query.combinator:
+        estimate = estimate_count(queryset)
+        if (estimate is not None
+                and estimate >= settings.COUNT_ESTIMATE_THRESHOLD):
+            return estimate, False
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0, True
+    signature = repr(
+        (sql, params, versions.get_versions(versions.tables_in_sql(sql)))
+    )
+    key = 'count:' + md5(signature.encode()).hexdigest()
+    count = cache.get(key)
+    record_cache('count', queryset.model._meta.label, (
+        'miss' if count is None else 'hit'
+    ))
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.COUNT_CACHE_TIMEOUT)
+    return count, True
@@ -1,5 +1,6 @@
 from django_filters.rest_framework import FilterSet, filters
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
 from users.models import UserFoodgram
 
 
@@ -22,17 +23,26 @@ class TagFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
 
-    def get_is_favorited(self, queryset, name, value):
+    def filter_by_flag(self, queryset, flag, value):
         if self.request.user.is_authenticated and value is True:
-            return queryset.filter(favorite__user=self.request.user)
+            if flag not in queryset.query.annotations:
+                queryset = queryset.with_user_flags(self.request.user)
+            return queryset.filter(**{flag: True})
         return queryset
 
+    def get_is_favorited(self, queryset, name, value):
+        return self.filter_by_flag(queryset, 'is_favorited', value)
+
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if self.request.user.is_authenticated and value is True:
-            return queryset.filter(shopping_cart__user=self.request.user)
-        return queryset
+        return self.filter_by_flag(queryset, 'is_in_shopping_cart', value)
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
@@ -0,0 +1,71 @@
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from recipes.models import Ingredient
+
+from . import versions
+
+
+class IngredientIndex:
+    """Отсортированный по названию список ингредиентов для автодополнения.
+
+    Совпадения по началу названия ищутся бинарным поиском,
+    совпадения по подстроке добавляются после них.
+    """
+
+    current = None
+
+    def __init__(self, ingredients, version=None):
+        entries = sorted(
+            (name.casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        self.version = version
+        self.built = time.monotonic()
+        self.keys = [entry[0] for entry in entries]
+        self.rows = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in entries
+        ]
+
+    @classmethod
+    def get(cls):
+        """Возвращает индекс процесса, перестраивая его после изменений
+        в таблице ингредиентов и не реже раза в INGREDIENT_INDEX_MAX_AGE
+        секунд — на случай изменений, не отразившихся на версии."""
+        version = versions.get_versions([Ingredient._meta.db_table])
+        if cls.current is None or not cls.current.fresh(version):
+            cls.current = cls(
+                Ingredient.objects.values_list(
+                    'pk', 'name', 'measurement_unit'
+                ).iterator(),
+                version=version,
+            )
+        return cls.current
+
+    def fresh(self, version):
+        age = time.monotonic() - self.built
+        return (
+            self.version == version
+            and age < settings.INGREDIENT_INDEX_MAX_AGE
+        )
+
+    def search(self, query, limit=None):
+        query = query.strip().casefold()
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, query + '\U0010ffff', lo=start)
+        results = self.rows[start:end]
+        if limit is not None and len(results) >= limit:
+            return results[:limit]
+        results.extend(
+            row for key, row in zip(self.keys, self.rows)
+            if query in key and not key.startswith(query)
+        )
+        return results[:limit]
+
+
+def search(query):
+    return IngredientIndex.get().search(
+        query, limit=settings.INGREDIENT_SEARCH_LIMIT
+    )
@@ -0,0 +1,319 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from api.timing import RequestTimings, observing_sql
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from foodgram.db import pool
+from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import UserFoodgram
+
+ENDPOINTS = (
+    ('recipes_list', False),
+    ('recipes_filtered', True),
+    ('recipe_detail', False),
+    ('tags', False),
+    ('ingredients_search', False),
+    ('users_list', True),
+    ('users_me', True),
+    ('subscriptions', True),
+    ('download_shopping_cart', True),
+)
+
+
+def percentile(quantiles, value):
+    return quantiles[value - 1] if quantiles else 0
+
+
+class Command(BaseCommand):
+    """API load benchmark."""
+    help = ('Прогнать основные эндпоинты API через WSGI-приложение '
+            'в несколько потоков и сохранить результаты в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Число запросов к каждому эндпоинту.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--endpoint', action='append',
+                            choices=[name for name, _ in ENDPOINTS],
+                            help='Запустить только указанные эндпоинты.')
+        parser.add_argument('--user', help='Пользователь для запросов '
+                            'с авторизацией, по умолчанию самый активный.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--asgi', action='store_true',
+                            help='Вызывать ASGI-приложение из цикла событий '
+                            'вместо WSGI-приложения из потоков.')
+        parser.add_argument('--output', help='Файл для результатов.')
+        parser.add_argument('--compare', help='Результаты прошлого запуска.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        if options['asgi']:
+            if not settings.ASGI:
+                raise CommandError('Режим --asgi требует ASGI=True.')
+            from foodgram.asgi import application
+            self.app = application
+        else:
+            self.app = get_wsgi_application()
+        self.prepare(options['user'])
+        self.connects = 0
+        self.lock = threading.Lock()
+        connection_created.connect(self.count_connection)
+        names = options['endpoint'] or [name for name, _ in ENDPOINTS]
+        results = {}
+        for name, authenticated in ENDPOINTS:
+            if name in names:
+                results[name] = self.run_endpoint(
+                    name, authenticated, options
+                )
+        connection_created.disconnect(self.count_connection)
+        report = {
+            'started': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'debug': settings.DEBUG,
+            'server': 'asgi' if options['asgi'] else 'wsgi',
+            'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+            'pool': connection.settings_dict.get('POOL'),
+            'pool_stats': pool.get_stats(),
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'results': results,
+        }
+        previous = self.load_previous(options['compare'])
+        self.print_report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'
+            ))
+
+    def prepare(self, username):
+        users = UserFoodgram.objects.annotate(
+            carts=Count('shopping_cart', distinct=True),
+            follows=Count('follower', distinct=True),
+        )
+        user = (
+            users.filter(username=username).first() if username
+            else users.order_by('-follows', '-carts').first()
+        )
+        self.recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+        if user is None or not self.recipe_ids:
+            raise CommandError(
+                'Нет данных для нагрузки: запустите seed_data.'
+            )
+        self.token = Token.objects.get_or_create(user=user)[0].key
+        self.tag_slugs = list(Tag.objects.values_list('slug', flat=True))
+        self.prefixes = list({
+            name[:3] for name in Ingredient.objects.values_list(
+                'name', flat=True
+            )[:500]
+        })
+
+    def count_connection(self, sender, connection, **kwargs):
+        with self.lock:
+            self.connects += 1
+
+    def opened_connections(self):
+        """Число физически открытых соединений с базой: при пуле Django
+        подключается к соединениям из пула, поэтому считаются созданные
+        пулом."""
+        if settings.DB_POOL:
+            return sum(
+                stats['created'] for stats in pool.get_stats().values()
+            )
+        return self.connects
+
+    def build_request(self, name):
+        """Путь и параметры запроса со случайными id из базы."""
+        rng = self.rng
+        paths = {
+            'recipes_list': ('/api/recipes/', {'page': rng.randint(1, 5)}),
+            'recipes_filtered': ('/api/recipes/', {
+                'tags': rng.choice(self.tag_slugs or ['']),
+                'is_favorited': 1,
+            }),
+            'recipe_detail': (
+                f'/api/recipes/{rng.choice(self.recipe_ids)}/', {}
+            ),
+            'tags': ('/api/tags/', {}),
+            'ingredients_search': ('/api/ingredients/', {
+                'name': rng.choice(self.prefixes or ['']),
+            }),
+            'users_list': ('/api/users/', {'page': rng.randint(1, 5)}),
+            'users_me': ('/api/users/me/', {}),
+            'subscriptions': ('/api/users/subscriptions/', {
+                'recipes_limit': 3,
+            }),
+            'download_shopping_cart': (
+                '/api/recipes/download_shopping_cart/', {}
+            ),
+        }
+        return paths[name]
+
+    def call(self, path, query, authenticated):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': urlencode(query),
+            'wsgi.input': BytesIO(),
+        }
+        if authenticated:
+            environ['HTTP_AUTHORIZATION'] = f'Token {self.token}'
+        setup_testing_defaults(environ)
+        status = []
+        started = time.perf_counter()
+        with observing_sql(RequestTimings()) as timings:
+            response = self.app(
+                environ, lambda code, headers, *args: status.append(code)
+            )
+            try:
+                size = sum(len(chunk) for chunk in response)
+            finally:
+                response.close()
+        elapsed = time.perf_counter() - started
+        return int(status[0].split()[0]), elapsed, timings.sql_count, size
+
+    async def call_asgi(self, path, query, authenticated):
+        headers = [(b'host', b'testserver')]
+        if authenticated:
+            headers.append((b'authorization', f'Token {self.token}'.encode()))
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': urlencode(query).encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        started = time.perf_counter()
+        with observing_sql(RequestTimings()) as timings:
+            await self.app(scope, receive, send)
+        elapsed = time.perf_counter() - started
+        size = sum(
+            len(message.get('body', b'')) for message in messages
+            if message['type'] == 'http.response.body'
+        )
+        return messages[0]['status'], elapsed, timings.sql_count, size
+
+    def run_endpoint(self, name, authenticated, options):
+        requests = [
+            self.build_request(name)
+            for _ in range(options['warmup'] + options['requests'])
+        ]
+        if options['asgi']:
+            samples, wall, connects = asyncio.run(self.run_asgi(
+                requests, authenticated, options
+            ))
+        else:
+            samples, wall, connects = self.run_wsgi(
+                requests, authenticated, options
+            )
+        latencies = [elapsed * 1000 for _, elapsed, _, _ in samples]
+        queries = [count for _, _, count, _ in samples]
+        quantiles = (
+            statistics.quantiles(latencies, n=100) if len(latencies) > 1
+            else latencies * 99
+        )
+        return {
+            'requests': len(samples),
+            'errors': sum(status >= 400 for status, _, _, _ in samples),
+            'throughput_rps': round(len(samples) / wall, 1),
+            'p50_ms': round(percentile(quantiles, 50), 2),
+            'p95_ms': round(percentile(quantiles, 95), 2),
+            'p99_ms': round(percentile(quantiles, 99), 2),
+            'mean_queries': round(statistics.mean(queries), 2),
+            'max_queries': max(queries),
+            'mean_bytes': round(
+                statistics.mean(size for _, _, _, size in samples)
+            ),
+            'connections_per_request': round(connects / len(samples), 2),
+        }
+
+    def run_wsgi(self, requests, authenticated, options):
+
+        def worker(request):
+            try:
+                return self.call(*request, authenticated)
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            list(executor.map(worker, requests[:options['warmup']]))
+            opened = self.opened_connections()
+            started = time.perf_counter()
+            samples = list(executor.map(
+                worker, requests[options['warmup']:]
+            ))
+            wall = time.perf_counter() - started
+        return samples, wall, self.opened_connections() - opened
+
+    async def run_asgi(self, requests, authenticated, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def worker(request):
+            async with semaphore:
+                return await self.call_asgi(*request, authenticated)
+
+        await asyncio.gather(*map(worker, requests[:options['warmup']]))
+        opened = self.opened_connections()
+        started = time.perf_counter()
+        samples = await asyncio.gather(
+            *map(worker, requests[options['warmup']:])
+        )
+        wall = time.perf_counter() - started
+        return samples, wall, self.opened_connections() - opened
+
+    @staticmethod
+    def load_previous(path):
+        if not path:
+            return {}
+        with open(path, encoding='UTF-8') as file:
+            return json.load(file)['results']
+
+    def print_report(self, results, previous):
+        self.stdout.write(
+            f'{"эндпоинт":<24}{"rps":>8}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"SQL":>7}{"соед.":>7}{"ошибки":>8}'
+        )
+        for name, result in results.items():
+            line = (
+                f'{name:<24}{result["throughput_rps"]:>8}'
+                f'{result["p50_ms"]:>9}{result["p95_ms"]:>9}'
+                f'{result["p99_ms"]:>9}{result["mean_queries"]:>7}'
+                f'{result["connections_per_request"]:>7}'
+                f'{result["errors"]:>8}'
+            )
+            if name in previous and previous[name]['p95_ms']:
+                change = result['p95_ms'] / previous[name]['p95_ms'] - 1
+                line += f'  p95 {change:+.0%}'
+            self.stdout.write(line)
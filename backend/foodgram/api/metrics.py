@@ -0,0 +1,94 @@
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpResponse
+from django.views.decorators.cache import never_cache
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram, Summary,
+                               generate_latest, multiprocess)
+
+from .timing import HybridMiddleware, RequestTimings, observing_sql
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время обработки запроса.',
+    ('method', 'route', 'status'),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Число SQL-запросов на HTTP-запрос.',
+    ('route',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_TIME = Histogram(
+    'foodgram_db_time_seconds',
+    'Суммарное время SQL-запросов на HTTP-запрос.',
+    ('route',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+RESPONSE_SIZE = Summary(
+    'foodgram_http_response_size_bytes',
+    'Размер тела ответа.',
+    ('route',),
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кэшам приложения: hit или miss.',
+    ('cache', 'name', 'result'),
+)
+
+
+def record_cache(cache, name, result):
+    CACHE_REQUESTS.labels(cache, name, result).inc()
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """Собирает метрики запросов для /api/metrics.
+
+    Маршрут берётся из имени view, а не из пути, чтобы число рядов
+    не росло вместе с числом объектов.
+    """
+    setting = 'METRICS'
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with observing_sql(RequestTimings()) as timings:
+            response = self.get_response(request)
+        return self.observe(request, response, timings)
+
+    async def __acall__(self, request):
+        with observing_sql(RequestTimings()) as timings:
+            response = await self.get_response(request)
+        return self.observe(request, response, timings)
+
+    @staticmethod
+    def observe(request, response, timings):
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        REQUEST_LATENCY.labels(
+            request.method, route, response.status_code
+        ).observe(time.perf_counter() - timings.started)
+        DB_QUERIES.labels(route).observe(timings.sql_count)
+        DB_TIME.labels(route).observe(timings.sql_time)
+        if not response.streaming:
+            RESPONSE_SIZE.labels(route).observe(len(response.content))
+        return response
+
+
+@never_cache
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus.
+
+    При запуске под gunicorn с PROMETHEUS_MULTIPROC_DIR значения
+    собираются из файлов всех воркеров.
+    """
+    registry = REGISTRY
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
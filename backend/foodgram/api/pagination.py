@@ -1,6 +1,131 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+from .asynchronous import concurrently, in_async_view
+from .counts import get_count
+
+
+class EstimatedCountPage(Page):
+    """Страница при оценочном числе объектов: соседние страницы
+    определяются по самим строкам, а не по count."""
+
+    def __init__(self, object_list, number, paginator, next_exists):
+        super().__init__(object_list, number, paginator)
+        self.next_exists = next_exists
+
+    def has_next(self):
+        return self.next_exists
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def end_index(self):
+        return (self.number - 1) * self.paginator.per_page + len(self)
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator с кэшированным COUNT(*).
+
+    Оценка числа объектов только показывается в ответе: страница тогда
+    строится без сверки номера с count, а следующая страница есть, если
+    нашлась лишняя строка. В асинхронном представлении строки страницы
+    и число объектов запрашиваются одновременно.
+    """
+
+    @cached_property
+    def counted(self):
+        return get_count(self.object_list)
+
+    @property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def count_is_exact(self):
+        return self.counted[1]
+
+    def page(self, number):
+        rows = None
+        if (in_async_view.get() and not self.orphans
+                and 'counted' not in self.__dict__):
+            bottom = (self.parse_number(number) - 1) * self.per_page
+            rows = concurrently(
+                lambda: self.fetch(bottom), lambda: self.counted
+            )[0]
+        if self.count_is_exact:
+            if rows is None:
+                return super().page(number)
+            return self._get_page(
+                rows[:self.per_page], self.validate_number(number), self
+            )
+        number = self.parse_number(number)
+        if rows is None:
+            rows = self.fetch((number - 1) * self.per_page)
+        if not rows and number > 1:
+            raise EmptyPage(_('That page contains no results'))
+        return EstimatedCountPage(
+            rows[:self.per_page], number, self, len(rows) > self.per_page
+        )
+
+    def fetch(self, bottom):
+        """Строки страницы и одна строка следующей."""
+        return list(self.object_list[bottom:bottom + self.per_page + 1])
+
+    @staticmethod
+    def parse_number(number):
+        """Номер страницы без сверки с числом объектов."""
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(_('That page number is not an integer'))
+        if number < 1:
+            raise EmptyPage(_('That page number is less than 1'))
+        return number
+
+
+class FoodgramCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    ordering = 'pk'
+
+    def get_ordering(self, request, queryset, view):
+        cursor_ordering = getattr(view, 'cursor_ordering', None)
+        if cursor_ordering:
+            return tuple(cursor_ordering)
+        return super().get_ordering(request, queryset, view)
 
 
 class FoodgramPageLimitPagination(PageNumberPagination):
+    """Постраничная пагинация с переходом на курсорную по параметру cursor.
+
+    Курсорный режим включается запросом с ?cursor= и ищет следующую
+    страницу по ключам view.cursor_ordering без OFFSET и COUNT(*).
+    """
     page_size = 6
     page_size_query_param = 'limit'
+    django_paginator_class = CachedCountPaginator
+    cursor_pagination_class = FoodgramCursorPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        response.data['count_is_exact'] = self.page.paginator.count_is_exact
+        return response
@@ -1,15 +1,41 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 from django.db import transaction
+from django.http import QueryDict
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from recipes import shopping_list
+from recipes.images import VARIANTS
 from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
                             ShoppingCart, Tag)
-from rest_framework import serializers, validators
+from rest_framework import serializers
+from rest_framework.settings import api_settings
 from users.models import Subscription, UserFoodgram
 
+from . import versions
+
 MAX_VALUE = 32000
 MIN_VALUE = 0
 
 
+def get_recipes_limit(request):
+    """Число рецептов автора в подписках, ограниченное сверху."""
+    max_limit = settings.SUBSCRIPTION_RECIPES_LIMIT
+    if request is None:
+        return max_limit
+    value = request.query_params.get(
+        'recipes_limit', request.query_params.get('recipe_limit')
+    )
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return max_limit
+    return min(max(limit, 0), max_limit)
+
+
 class CustomUserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField(
         method_name='get_is_subscribed',
@@ -27,12 +53,22 @@ class CustomUserSerializer(UserSerializer):
             'is_subscribed'
         ]
 
+    def get_subscribed_ids(self, user):
+        """Загружает id авторов, на которых подписан пользователь,
+        один раз на весь запрос."""
+        subscribed_ids = self.context.get('subscribed_ids')
+        if subscribed_ids is None:
+            subscribed_ids = set(
+                user.follower.values_list('author_id', flat=True)
+            )
+            self.context['subscribed_ids'] = subscribed_ids
+        return subscribed_ids
+
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
-        user = request.user
-        return obj.following.filter(user=user).exists()
+        return obj.id in self.get_subscribed_ids(request.user)
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -50,6 +86,35 @@ class TagField(serializers.SlugRelatedField):
         return serializer.data
 
 
+class RecipeImageField(Base64ImageField):
+    """Изображение в base64 или файлом из multipart/form-data.
+
+    Размеры проверяются по заголовку файла, без декодирования пикселей.
+    """
+    default_error_messages = {
+        'too_large': 'Изображение не может быть больше {max_side}px '
+                     'по каждой стороне.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            image = serializers.ImageField.to_internal_value(self, data)
+        else:
+            image = super().to_internal_value(data)
+        if image is not None:
+            self.validate_dimensions(image)
+        return image
+
+    def validate_dimensions(self, image):
+        max_side = settings.RECIPE_IMAGE_MAX_SIDE
+        image.seek(0)
+        with Image.open(image) as opened:
+            width, height = opened.size
+        image.seek(0)
+        if width > max_side or height > max_side:
+            self.fail('too_large', max_side=max_side)
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
@@ -67,19 +132,12 @@ class IngredientsInRecipeSerializer(serializers.ModelSerializer):
         model = IngredientsInRecipe
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
-    validators = (
-        validators.UniqueTogetherValidator(
-            queryset=IngredientsInRecipe.objects.all(),
-            fields=('ingredient', 'recipe')
-        ),
-    )
-
     def __str__(self):
         return f'{self.ingredient} добавлен в {self.recipe}'
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField(min_value=1)
     amount = serializers.IntegerField()
 
     class Meta:
@@ -100,6 +158,9 @@ class ListRecipeSerializer(serializers.ModelSerializer):
         many=True
     )
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField(
+        method_name='get_image_variants'
+    )
     is_favorited = serializers.SerializerMethodField(
         method_name='get_is_favorited'
     )
@@ -118,30 +179,46 @@ class ListRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
         )
 
-    def in_list(self, obj, model):
+    def get_image_variants(self, obj):
+        if obj.image_variants.get('source') != obj.image.name:
+            return {}
+        request = self.context.get('request')
+        storage = obj.image.storage
+        variants = {}
+        for name in VARIANTS:
+            # Копии, которых ещё нет, появятся после пересборки.
+            if name not in obj.image_variants:
+                continue
+            url = storage.url(obj.image_variants[name])
+            variants[name] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return variants
+
+    def in_list(self, obj, model, flag):
+        if hasattr(obj, flag):
+            return getattr(obj, flag)
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
         return model.objects.filter(user=request.user, recipe=obj).exists()
 
     def get_is_favorited(self, obj):
-        return self.in_list(obj, Favorite)
+        return self.in_list(obj, Favorite, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return self.in_list(obj, ShoppingCart)
+        return self.in_list(obj, ShoppingCart, 'is_in_shopping_cart')
 
 
 class CUDRecipeSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
     ingredients = AddIngredientSerializer(many=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -154,13 +231,77 @@ class CUDRecipeSerializer(serializers.ModelSerializer):
             'cooking_time'
         ]
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def parse_form_data(data):
+        """Приводит multipart/form-data к виду JSON-запроса: tags —
+        повторяющееся поле, ingredients — строка с JSON-массивом."""
+        parsed = {key: data.get(key) for key in data}
+        if 'tags' in data:
+            parsed['tags'] = data.getlist('tags')
+        if isinstance(parsed.get('ingredients'), str):
+            try:
+                parsed['ingredients'] = json.loads(parsed['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError({
+                    'ingredients': 'Ожидается JSON-массив ингредиентов'
+                })
+        return parsed
+
     def validate(self, data):
-        self.val_ingredients(data)
-        self.val_tags(data)
-        self.val_recipe_existence(data)
-        self.val_cooking_time(data)
+        """Собирает ошибки всех проверок в один ответ."""
+        errors = {}
+        for check in (
+            self.val_references,
+            self.val_ingredients,
+            self.val_tags,
+            self.val_recipe_existence,
+            self.val_cooking_time,
+        ):
+            try:
+                check(data)
+            except serializers.ValidationError as error:
+                detail = error.detail
+                if not isinstance(detail, dict):
+                    detail = {api_settings.NON_FIELD_ERRORS_KEY: detail}
+                for field, messages in detail.items():
+                    errors.setdefault(field, []).extend(
+                        messages if isinstance(messages, list) else [messages]
+                    )
+        if errors:
+            raise serializers.ValidationError(errors)
         return data
 
+    def val_references(self, data):
+        """Заменяет id ингредиентов и тегов объектами, загружая их
+        одним запросом на модель."""
+        ingredients = Ingredient.objects.in_bulk(
+            {ingredient['id'] for ingredient in data['ingredients']}
+        )
+        tags = Tag.objects.in_bulk(set(data['tags']))
+        errors = {}
+        missing = sorted({
+            ingredient['id'] for ingredient in data['ingredients']
+        } - ingredients.keys())
+        if missing:
+            errors['ingredients'] = [
+                f'Ингредиент с id={pk} не существует' for pk in missing
+            ]
+        missing = sorted(set(data['tags']) - tags.keys())
+        if missing:
+            errors['tags'] = [
+                f'Тэг с id={pk} не существует' for pk in missing
+            ]
+        if errors:
+            raise serializers.ValidationError(errors)
+        for ingredient in data['ingredients']:
+            ingredient['id'] = ingredients[ingredient['id']]
+        data['tags'] = [tags[pk] for pk in data['tags']]
+
     def val_ingredients(self, data):
         ingredients = data['ingredients']
         ingredients_set = set()
@@ -190,7 +331,7 @@ class CUDRecipeSerializer(serializers.ModelSerializer):
         return ingredients
 
     def val_tags(self, data):
-        tags = self.initial_data.get('tags')
+        tags = data['tags']
         if len(tags) != len(set(tags)):
             raise serializers.ValidationError({
                 'tags': 'В рецепте не может быть повторяющихся тэгов'
@@ -204,7 +345,10 @@ class CUDRecipeSerializer(serializers.ModelSerializer):
             return False
         user = request.user
         if recipe and user:
-            if user.recipe.filter(name=recipe).exists():
+            recipes = user.recipe.filter(name=recipe)
+            if self.instance is not None:
+                recipes = recipes.exclude(pk=self.instance.pk)
+            if recipes.exists():
                 raise serializers.ValidationError('Рецепт уже добавлен')
 
     def val_cooking_time(self, data):
@@ -243,19 +387,61 @@ class CUDRecipeSerializer(serializers.ModelSerializer):
         self.create_ingredients(ingredients, recipe)
         return recipe
 
+    @staticmethod
+    def update_ingredients(ingredients, recipe):
+        """Приводит ингредиенты рецепта к новому списку, меняя только
+        отличающиеся строки."""
+        shopping_list.lock_recipes([recipe.pk])
+        current = {
+            row.ingredient_id: row
+            for row in IngredientsInRecipe.objects.select_for_update().filter(
+                recipe=recipe
+            )
+        }
+        old_amounts = {pk: row.amount for pk, row in current.items()}
+        new_amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        created = [
+            IngredientsInRecipe(
+                recipe=recipe, ingredient_id=pk, amount=amount
+            )
+            for pk, amount in new_amounts.items() if pk not in current
+        ]
+        changed = []
+        for pk, row in current.items():
+            if pk in new_amounts and new_amounts[pk] != row.amount:
+                row.amount = new_amounts[pk]
+                changed.append(row)
+        deleted = [pk for pk in current if pk not in new_amounts]
+        if deleted:
+            IngredientsInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=deleted
+            ).delete()
+        IngredientsInRecipe.objects.bulk_update(changed, ('amount',))
+        IngredientsInRecipe.objects.bulk_create(created)
+        if changed or created:
+            # bulk_update и bulk_create не отправляют сигналы.
+            versions.mark_changed([
+                IngredientsInRecipe._meta.db_table,
+                versions.row(Recipe._meta.db_table, recipe.pk),
+            ])
+        shopping_list.change_recipe(recipe, old_amounts, new_amounts)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        self.create_ingredients(ingredients, instance)
-        instance.tags.clear()
-        instance.tags.set(tags)
+        self.update_ingredients(validated_data.pop('ingredients'), instance)
+        instance.tags.set(validated_data.pop('tags'))
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        user = request.user if request else None
+        instance = Recipe.objects.with_related().with_user_flags(
+            user
+        ).get(pk=instance.pk)
         return ListRecipeSerializer(instance, context=context).data
 
 
@@ -266,6 +452,30 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'cooking_time')
 
 
+class BatchRecipesSerializer(serializers.Serializer):
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.RECIPE_BATCH_LIMIT
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.RECIPE_BATCH_LIMIT
+    )
+
+    def validate(self, data):
+        if not data['add'] and not data['remove']:
+            raise serializers.ValidationError(
+                'Укажите рецепты для добавления или удаления'
+            )
+        if set(data['add']) & set(data['remove']):
+            raise serializers.ValidationError(
+                'Нельзя одновременно добавить и удалить рецепт'
+            )
+        return data
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
@@ -298,22 +508,24 @@ class SubscriptionSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
-        user = request.user
-        return user.follower.all().exists()
+        if not request or request.user.is_anonymous:
+            return False
+        return obj.user_id == request.user.id
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        if request.GET.get('recipe_limit'):
-            recipe_limit = int(request.GET.get('recipe_limit'))
-            queryset = obj.author.recipe.all()[:recipe_limit]
+        if hasattr(obj.author, 'limited_recipes'):
+            queryset = obj.author.limited_recipes
         else:
-            queryset = obj.author.recipe.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            queryset = obj.author.recipe.all()[:recipes_limit]
         serializer = ShortRecipeSerializer(
             queryset, read_only=True, many=True
         )
         return serializer.data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         return obj.author.recipe.count()
 
 
@@ -326,6 +538,9 @@ class SubscribeSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         request = self.context.get('request')
         context = {'request': request}
+        instance = Subscription.objects.with_recipes(
+            get_recipes_limit(request)
+        ).get(pk=instance.pk)
         serializer = SubscriptionSerializer(
             instance,
             context=context
@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import IngredientsInRecipe, Recipe
+from users.models import UserFoodgram
+
+from . import versions
+from .timing import observe_sql
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def bump_table_version(sender, action=None, update_fields=None, **kwargs):
+    if sender._meta.app_label not in versions.TRACKED_APPS:
+        return
+    if action is not None and not action.startswith('post_'):
+        return
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    versions.mark_changed([sender._meta.db_table])
+
+
+def changed_recipes(sender, instance, pk_set=None, created=False, **kwargs):
+    """Рецепты, карточка которых меняется вместе с записью в sender."""
+    if sender is Recipe:
+        return [instance.pk]
+    if sender is IngredientsInRecipe:
+        return [instance.recipe_id]
+    if sender is Recipe.tags.through:
+        return [instance.pk] if isinstance(instance, Recipe) else pk_set
+    if sender is UserFoodgram and not created:
+        return instance.recipe.values_list('pk', flat=True)
+    return ()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+@receiver(m2m_changed)
+def bump_recipe_version(sender, action=None, update_fields=None, **kwargs):
+    """Меняет версии строк рецептов, по которым кэшируется их карточка."""
+    if action is not None and not action.startswith('post_'):
+        return
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    table = Recipe._meta.db_table
+    rows = [
+        versions.row(table, pk)
+        for pk in changed_recipes(sender, **kwargs) or ()
+    ]
+    if rows:
+        versions.mark_changed(rows)
+
+
+@receiver(connection_created)
+def install_sql_observer(sender, connection, **kwargs):
+    # Соединение может открыться внутри чужого блока execute_wrapper(),
+    # который при выходе снимает последний элемент списка, поэтому
+    # наблюдатель ставится в начало, а не в конец.
+    if observe_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, observe_sql)
+
+
+@receiver(request_finished)
+def mark_connections_idle(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+@receiver(request_started)
+def check_idle_connections(**kwargs):
+    """Закрывает сохранённые по CONN_MAX_AGE соединения, которые простояли
+    дольше DB_HEALTH_CHECK_INTERVAL и больше не отвечают: иначе на таком
+    соединении упал бы первый запрос к базе."""
+    deadline = time.monotonic() - settings.DB_HEALTH_CHECK_INTERVAL
+    for connection in connections.all():
+        idle_since = getattr(connection, 'idle_since', None)
+        if (connection.connection is not None
+                and idle_since is not None and idle_since < deadline
+                and not connection.is_usable()):
+            connection.close()
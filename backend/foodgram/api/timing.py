@@ -0,0 +1,269 @@
+import cProfile
+import functools
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.text import slugify
+from rest_framework import serializers
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+logger = logging.getLogger(__name__)
+
+current_timings = ContextVar('current_timings', default=None)
+sql_observers = ContextVar('sql_observers', default=())
+active_spans = ContextVar('active_spans', default=frozenset())
+
+
+class RequestTimings:
+    """Время частей обработки одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.view_finished = None
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.spans = {}
+
+    def add_query(self, duration):
+        self.sql_count += 1
+        self.sql_time += duration
+
+    def add(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+
+def observe_sql(execute, sql, params, many, context):
+    """Передаёт время SQL-запроса наблюдателям текущего HTTP-запроса.
+
+    Наблюдатели хранятся в контекстной переменной, поэтому учитываются
+    и запросы, выполненные в других потоках через sync_to_async.
+    """
+    observers = sql_observers.get()
+    if not observers:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for observer in observers:
+            observer.add_query(duration)
+
+
+@contextmanager
+def observing_sql(observer):
+    token = sql_observers.set(sql_observers.get() + (observer,))
+    try:
+        yield observer
+    finally:
+        sql_observers.reset(token)
+
+
+def timed(name, method):
+    """Добавляет время вызова method к части name текущего запроса.
+
+    Вызовы внутри уже засекаемой части name не засекаются повторно,
+    иначе их время вошло бы в неё дважды.
+    """
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        timings = current_timings.get()
+        spans = active_spans.get()
+        if timings is None or name in spans:
+            return method(*args, **kwargs)
+        token = active_spans.set(spans | {name})
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            timings.add(name, time.perf_counter() - started)
+            active_spans.reset(token)
+
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument_serializers():
+    """Засекает сериализацию и построение URL файлов.
+
+    BaseSerializer.data вызывают и поля внутри сериализации, например
+    TagField, поэтому засекается только внешний вызов, см. timed().
+    """
+    data = serializers.BaseSerializer.data
+    if getattr(data.fget, 'timed', False):
+        return
+    serializers.BaseSerializer.data = property(timed('serializer', data.fget))
+    serializers.FileField.to_representation = timed(
+        'files', serializers.FileField.to_representation
+    )
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 2)
+
+
+class HybridMiddleware:
+    """Основа middleware, работающего и под WSGI, и под ASGI.
+
+    Под ASGI экземпляр помечается корутинной функцией, а __call__
+    наследника возвращает корутину своего __acall__, поэтому Django
+    не уводит обработку запроса в отдельный поток ради этого middleware.
+    Включается настройкой из атрибута setting.
+    """
+    sync_capable = True
+    async_capable = True
+    setting = None
+
+    def __init__(self, get_response):
+        if not getattr(settings, self.setting):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+
+class ServerTimingMiddleware(HybridMiddleware):
+    """Заголовок Server-Timing и строка лога с разбивкой времени запроса.
+
+    Включается настройкой SERVER_TIMING. Запрос сотрудника с параметром
+    ?profile выполняется под cProfile, а файл профиля сохраняется
+    в SERVER_TIMING_PROFILE_DIR.
+    """
+    setting = 'SERVER_TIMING'
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        instrument_serializers()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        profiler = cProfile.Profile() if self.profiling(request) else None
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            with observing_sql(timings):
+                if profiler is None:
+                    response = self.get_response(request)
+                else:
+                    response = profiler.runcall(self.get_response, request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, profiler)
+
+    async def __acall__(self, request):
+        profiling = (
+            'profile' in request.GET
+            and await sync_to_async(self.profiling)(request)
+        )
+        profiler = cProfile.Profile() if profiling else None
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        try:
+            with observing_sql(timings):
+                # cProfile следит только за потоком, в котором включён.
+                # Синхронные представления запроса выполняются в его
+                # общем потоке sync_to_async, поэтому профиль включается
+                # там, а не в цикле событий.
+                if profiler is not None:
+                    await sync_to_async(profiler.enable)()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        await sync_to_async(profiler.disable)()
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, profiler)
+
+    def finish(self, request, response, timings, profiler):
+        finished = time.perf_counter()
+        record = self.build_record(request, response, timings, finished)
+        if profiler is not None:
+            record['profile'] = response['X-Profile'] = self.dump_profile(
+                profiler, request
+            )
+        response['Server-Timing'] = self.build_header(record)
+        logger.info(json.dumps(record, ensure_ascii=False))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = current_timings.get()
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timings = current_timings.get()
+        if timings is not None:
+            timings.view_finished = time.perf_counter()
+        return response
+
+    @staticmethod
+    def build_record(request, response, timings, finished):
+        view_started = timings.view_started or finished
+        view_finished = timings.view_finished or finished
+        match = request.resolver_match
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'bytes': None if response.streaming else len(response.content),
+            'total_ms': milliseconds(finished - timings.started),
+            'view_ms': milliseconds(view_finished - view_started),
+            'render_ms': milliseconds(finished - view_finished),
+            'db_ms': milliseconds(timings.sql_time),
+            'db_queries': timings.sql_count,
+            **{
+                f'{name}_ms': milliseconds(duration)
+                for name, duration in timings.spans.items()
+            },
+        }
+
+    @staticmethod
+    def build_header(record):
+        metrics = [
+            f'db;dur={record["db_ms"]};desc="{record["db_queries"]} queries"',
+            f'view;dur={record["view_ms"]}',
+        ]
+        metrics.extend(
+            f'{name};dur={record[f"{name}_ms"]}'
+            for name in ('serializer', 'files')
+            if f'{name}_ms' in record
+        )
+        metrics.append(f'render;dur={record["render_ms"]}')
+        metrics.append(f'total;dur={record["total_ms"]}')
+        if record['bytes'] is not None:
+            metrics.append(f'size;desc="{record["bytes"]} bytes"')
+        return ', '.join(metrics)
+
+    @staticmethod
+    def profiling(request):
+        if 'profile' not in request.GET:
+            return False
+        try:
+            result = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return result is not None and result[0].is_staff
+
+    @staticmethod
+    def dump_profile(profiler, request):
+        directory = Path(settings.SERVER_TIMING_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = '{}-{}.prof'.format(
+            int(time.time() * 1000), slugify(request.path) or 'root'
+        )
+        profiler.dump_stats(directory / name)
+        return name
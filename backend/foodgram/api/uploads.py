@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """Прерывает загрузку файла, как только он превышает
+    FILE_UPLOAD_MAX_SIZE, не дожидаясь конца запроса."""
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.FILE_UPLOAD_MAX_SIZE:
+            raise MultiPartParserError(
+                'Размер файла превышает '
+                f'{settings.FILE_UPLOAD_MAX_SIZE} байт'
+            )
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
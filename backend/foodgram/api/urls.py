@@ -1,6 +1,7 @@
+from api.metrics import metrics_view
 from api.views import (IngredientViewSet, RecipeViewSet, SubscribeView,
                        SubscriptionViewSet, TagViewSet, UserFoodgramViewSet)
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
 app_name = 'api'
@@ -22,4 +23,5 @@ urlpatterns = [
     path('', include(router.urls)),
     path('users/<int:pk>/subscribe/', SubscribeView.as_view()),
     path('auth/', include('djoser.urls.authtoken')),
+    re_path(r'^metrics/?$', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,64 @@
+import time
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import transaction
+
+KEY_PREFIX = 'table_version:'
+VERSIONS_CACHE = 'versions'
+TRACKED_APPS = ('recipes', 'users')
+
+
+def row(table, pk):
+    """Имя версии одной строки таблицы для get_versions и mark_changed."""
+    return f'{table}:{pk}'
+
+
+def get_versions(tables):
+    """Возвращает версии таблиц — метки времени последней записи в них.
+    Вместо таблицы можно передать строку, см. row().
+
+    Версии хранятся в отдельном кэше Django без вытеснения и меняются
+    обработчиками сигналов, поэтому при общем бэкенде кэша они
+    согласованы между процессами.
+    """
+    cache = caches[VERSIONS_CACHE]
+    keys = [KEY_PREFIX + table for table in tables]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, timeout=None)
+        versions.update(cache.get_many(missing))
+    return tuple(versions.get(key, 0) for key in keys)
+
+
+def bump(tables):
+    now = time.time()
+    caches[VERSIONS_CACHE].set_many(
+        {KEY_PREFIX + table: now for table in tables}, timeout=None
+    )
+
+
+def mark_changed(tables):
+    """Меняет версии таблиц сразу и ещё раз после коммита: иначе ответ,
+    собранный параллельным запросом по незакоммиченным данным, остался бы
+    в кэше под новой версией."""
+    bump(tables)
+    transaction.on_commit(lambda: bump(tables))
+
+
+def tracked_tables():
+    return sorted(
+        model._meta.db_table
+        for app_label in TRACKED_APPS
+        for model in apps.get_app_config(app_label).get_models(
+            include_auto_created=True
+        )
+    )
+
+
+def tables_in_sql(sql):
+    """Таблицы приложений, упомянутые в SQL, включая подзапросы."""
+    return [table for table in tracked_tables() if f'"{table}"' in sql]
@@ -1,24 +1,35 @@
+from hashlib import md5
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
+from recipes import shopping_list
 from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
-                            ShoppingCart, Tag)
-from recipes.utils import convert_txt
+                            ShoppingCart, ShoppingList, ShoppingListItem, Tag)
+from recipes.utils import SHOPPING_LIST_CONVERTERS
 from rest_framework import filters, mixins, status, views, viewsets
 from rest_framework.decorators import action
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from users.models import Subscription, UserFoodgram
 
+from . import ingredient_index, versions
+from .asynchronous import AsyncViewSetMixin, concurrently
+from .caching import AnonymousResponseCacheMixin, ConditionalGetMixin
 from .filters import IngredientFilter, TagFilter
 from .pagination import FoodgramPageLimitPagination
 from .permissions import IsAuthorOrAdminOrGuest
-from .serializers import (CUDRecipeSerializer, CustomUserSerializer,
-                          IngredientSerializer, ListRecipeSerializer,
-                          ShortRecipeSerializer, SubscribeSerializer,
-                          SubscriptionSerializer, TagSerializer)
+from .renderers import CSVRenderer, PDFRenderer, TXTRenderer
+from .serializers import (BatchRecipesSerializer, CUDRecipeSerializer,
+                          CustomUserSerializer, IngredientSerializer,
+                          ListRecipeSerializer, ShortRecipeSerializer,
+                          SubscribeSerializer, SubscriptionSerializer,
+                          TagSerializer, get_recipes_limit)
 
 User = get_user_model()
 
@@ -26,6 +37,7 @@ User = get_user_model()
 class UserFoodgramViewSet(UserViewSet):
     serializer_class = CustomUserSerializer
     pagination_class = FoodgramPageLimitPagination
+    cursor_ordering = ('id',)
 
     @action(['get'], detail=False, permission_classes=[IsAuthenticated])
     def me(self, request, *args, **kwargs):
@@ -34,6 +46,9 @@ class UserFoodgramViewSet(UserViewSet):
 
 
 class TagViewSet(
+    AsyncViewSetMixin,
+    ConditionalGetMixin,
+    AnonymousResponseCacheMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     viewsets.GenericViewSet
@@ -41,25 +56,94 @@ class TagViewSet(
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
+    cache_models = (Tag,)
+
+
+class IngredientSearchMixin(mixins.ListModelMixin):
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
 class IngredientViewSet(
+    AsyncViewSetMixin,
+    ConditionalGetMixin,
+    AnonymousResponseCacheMixin,
     mixins.RetrieveModelMixin,
-    mixins.ListModelMixin,
+    IngredientSearchMixin,
     viewsets.GenericViewSet
 ):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
     filterset_class = IngredientFilter
+    cache_models = (Ingredient,)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AsyncViewSetMixin,
+    ConditionalGetMixin,
+    AnonymousResponseCacheMixin,
+    viewsets.ModelViewSet
+):
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdminOrGuest,)
     pagination_class = FoodgramPageLimitPagination
+    cursor_ordering = ('-pub_date', 'id')
     filter_backends = (DjangoFilterBackend,)
     filterset_class = TagFilter
+    parser_classes = (JSONParser, MultiPartParser, FormParser)
+    cache_models = (
+        Recipe,
+        Recipe.tags.through,
+        IngredientsInRecipe,
+        Tag,
+        Ingredient,
+        UserFoodgram,
+    )
+    user_cache_models = (Favorite, ShoppingCart, Subscription)
+    subscribed_ids = None
+
+    def get_cache_versions(self):
+        """Списки зависят от таблиц целиком, карточка — от версии своего
+        рецепта, которую меняют его ингредиенты, тэги и автор."""
+        pk = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if self.action != 'retrieve' or not str(pk).isdigit():
+            return super().get_cache_versions()
+        return [
+            versions.row(Recipe._meta.db_table, int(pk)),
+            Tag._meta.db_table,
+            Ingredient._meta.db_table,
+        ]
+
+    def get_queryset(self):
+        queryset = super().get_queryset().with_user_flags(self.request.user)
+        if self.action in ('list', 'retrieve'):
+            return queryset.with_related()
+        return queryset
+
+    def get_object(self):
+        user = self.request.user
+        if self.action != 'retrieve' or user.is_anonymous:
+            return super().get_object()
+        recipe, self.subscribed_ids = concurrently(
+            super().get_object,
+            lambda: set(user.follower.values_list('author_id', flat=True)),
+        )
+        return recipe
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.subscribed_ids is not None:
+            context['subscribed_ids'] = self.subscribed_ids
+        return context
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), shopping_list.deferred():
+            instance.delete()
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -82,17 +166,36 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         detail=False,
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(TXTRenderer, CSVRenderer, PDFRenderer)
     )
     def download_shopping_cart(self, request):
-        ingredients = IngredientsInRecipe.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).order_by(
-            'ingredient__name'
-        ).annotate(ingredient_total=Sum('amount'))
-        return convert_txt(ingredients)
+        aggregate = ShoppingList.objects.filter(user=request.user).first()
+        file_format = request.accepted_renderer.format
+        if aggregate is None:
+            # Списка ещё нет: он пуст, и ETag зависит только от формата.
+            key = (None, file_format)
+            items = ShoppingListItem.objects.none()
+        else:
+            key = (
+                aggregate.pk,
+                aggregate.version,
+                file_format,
+                versions.get_versions([Ingredient._meta.db_table]),
+            )
+            items = aggregate.items
+        etag = '"{}"'.format(md5(repr(key).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            ingredients = items.values(
+                'ingredient__name',
+                'ingredient__measurement_unit',
+                ingredient_total=F('amount'),
+            ).order_by('ingredient__name')
+            response = SHOPPING_LIST_CONVERTERS[file_format](ingredients)
+            response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     @action(
         detail=True,
@@ -104,30 +207,114 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.add_recipe(ShoppingCart, request, pk)
         return self.delete_recipe(ShoppingCart, request, pk)
 
+    @action(
+        detail=False,
+        methods=('post',),
+        permission_classes=(IsAuthenticated,),
+        url_path='favorite/batch',
+        url_name='favorite-batch'
+    )
+    def favorite_batch(self, request):
+        return self.batch_recipes(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=('post',),
+        permission_classes=(IsAuthenticated,),
+        url_path='shopping_cart/batch',
+        url_name='shopping-cart-batch'
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_recipes(ShoppingCart, request)
+
     def add_recipe(self, model, request, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
         user = self.request.user
-        model.objects.create(recipe=recipe, user=user)
+        with transaction.atomic():
+            lock_user(user)
+            _, created = model.objects.get_or_create(recipe=recipe, user=user)
+        if not created:
+            return Response(
+                {'errors': 'Рецепт уже добавлен'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         serializer = ShortRecipeSerializer(recipe)
         return Response(data=serializer.data, status=status.HTTP_201_CREATED)
 
+    def batch_recipes(self, model, request):
+        """Добавляет и удаляет пачку рецептов одной вставкой и одним
+        удалением, возвращая результат по каждому id."""
+        serializer = BatchRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        add = list(dict.fromkeys(serializer.validated_data['add']))
+        remove = list(dict.fromkeys(serializer.validated_data['remove']))
+        user = request.user
+        found = set(Recipe.objects.filter(
+            pk__in=add
+        ).values_list('pk', flat=True))
+        with transaction.atomic(), shopping_list.deferred():
+            lock_user(user)
+            existing = set(model.objects.filter(
+                user=user, recipe_id__in=add + remove
+            ).values_list('recipe_id', flat=True))
+            added = [pk for pk in add if pk in found and pk not in existing]
+            removed = [pk for pk in remove if pk in existing]
+            model.objects.bulk_create(
+                [model(user=user, recipe_id=pk) for pk in added]
+            )
+            model.objects.filter(user=user, recipe_id__in=removed).delete()
+            if added:
+                # bulk_create не отправляет post_save.
+                versions.mark_changed([model._meta.db_table])
+                if model is ShoppingCart:
+                    shopping_list.add_recipes(user.pk, added)
+        return Response({
+            'add': [
+                {'id': pk, 'status': batch_status(pk, added, existing)}
+                for pk in add
+            ],
+            'remove': [
+                {'id': pk, 'status': batch_status(pk, removed, existing)}
+                for pk in remove
+            ],
+        })
+
     def delete_recipe(self, model, request, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
         user = self.request.user
-        obj = get_object_or_404(model, recipe=recipe, user=user)
-        obj.delete()
+        with transaction.atomic():
+            lock_user(user)
+            obj = get_object_or_404(model, recipe=recipe, user=user)
+            obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def lock_user(user):
+    """Блокирует строку пользователя до конца транзакции: изменения его
+    избранного и корзины выполняются по очереди и видят друг друга."""
+    UserFoodgram.objects.select_for_update().only('pk').get(pk=user.pk)
+
+
+def batch_status(pk, changed, existing):
+    if pk in changed:
+        return 'ok'
+    if pk in existing:
+        return 'exists'
+    return 'not_found'
+
+
 class SubscriptionViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
     filter_backends = (DjangoFilterBackend, filters.OrderingFilter)
     ordering = ('author__first_name',)
     pagination_class = FoodgramPageLimitPagination
+    cursor_ordering = ('author_id',)
     serializer_class = SubscriptionSerializer
 
     def get_queryset(self):
-        return Subscription.objects.filter(user=self.request.user)
+        return Subscription.objects.filter(
+            user=self.request.user
+        ).with_recipes(get_recipes_limit(self.request))
 
 
 class SubscribeView(views.APIView):
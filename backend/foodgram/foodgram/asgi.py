@@ -9,8 +9,84 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+
+def encode_headers(response):
+    headers = []
+    for header, value in response.items():
+        if isinstance(header, str):
+            header = header.encode('ascii')
+        if isinstance(value, str):
+            value = value.encode('latin1')
+        headers.append((bytes(header), bytes(value)))
+    for cookie in response.cookies.values():
+        headers.append(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+        )
+    return headers
+
+
+def read_chunk(parts, size):
+    """Следующие части потокового ответа общим размером не меньше size;
+    пустая строка — конец ответа."""
+    chunk = []
+    length = 0
+    for part in parts:
+        chunk.append(part)
+        length += len(part)
+        if length >= size:
+            break
+    return b''.join(chunk)
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """Читает потоковые ответы в потоке запроса.
+
+    Django 3.2 перебирает потоковый ответ прямо в цикле событий, где
+    запросы к базе запрещены, а выгрузка списка покупок читает строки
+    из базы по мере отправки. Здесь части ответа собираются в потоке,
+    где выполнялось представление, и отправляются по chunk_size байт,
+    поэтому ответ не накапливается в памяти целиком.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            await super().send_response(response, send)
+            return
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': encode_headers(response),
+        })
+        parts = iter(response)
+        read = sync_to_async(read_chunk, thread_sensitive=True)
+        while True:
+            chunk = await read(parts, self.chunk_size)
+            if not chunk:
+                break
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': True,
+            })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+
+async def application(scope, receive, send):
+    """Синхронный код каждого запроса выполняется в своём потоке.
+
+    Django 3.2 выполняет все синхронные представления процесса в одном
+    общем потоке, из-за чего запросы шли бы строго по очереди.
+    """
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
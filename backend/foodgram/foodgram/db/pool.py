@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+from prometheus_client import Counter, Gauge, Histogram
+
+POOL_CONNECTIONS = Gauge(
+    'foodgram_db_pool_connections',
+    'Соединения пула: свободные и выданные.',
+    ('alias', 'state'),
+    multiprocess_mode='livesum',
+)
+POOL_EVENTS = Counter(
+    'foodgram_db_pool_events_total',
+    'События пула: новые, повторно выданные, закрытые соединения, '
+    'проверки и таймауты.',
+    ('alias', 'event'),
+)
+POOL_WAIT = Histogram(
+    'foodgram_db_pool_wait_seconds',
+    'Время ожидания свободного соединения.',
+    ('alias',),
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+
+class PoolTimeoutError(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """Пул соединений одного процесса для одного алиаса базы.
+
+    Выдаёт последнее возвращённое соединение, открывает новое функцией
+    connect, пока соединений меньше max_size, иначе ждёт освобождения
+    не дольше timeout.
+    Соединения, простоявшие без дела дольше max_idle, закрываются,
+    а простоявшие дольше check_interval перед выдачей проверяются.
+    """
+
+    def __init__(self, alias, reset, check, max_size, max_idle, timeout,
+                 check_interval):
+        self.alias = alias
+        self.reset = reset
+        self.check = check
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.idle = deque()
+        self.size = 0
+        self.condition = threading.Condition()
+        self.events = dict.fromkeys(
+            ('created', 'reused', 'checked', 'discarded', 'expired',
+             'timeout'),
+            0,
+        )
+
+    def acquire(self, connect):
+        started = time.monotonic()
+        while True:
+            connection, released = self.take(started)
+            if connection is None or self.usable(connection, released):
+                break
+        POOL_WAIT.labels(self.alias).observe(time.monotonic() - started)
+        if connection is None:
+            return self.open(connect)
+        self.count('reused')
+        self.update_gauges()
+        return connection
+
+    def take(self, started):
+        """Свободное соединение со временем его возврата или (None, None),
+        если можно открыть новое."""
+        expired = []
+        try:
+            with self.condition:
+                while True:
+                    expired.extend(self.expire())
+                    if self.idle:
+                        return self.idle.pop()
+                    if self.size < self.max_size:
+                        self.size += 1
+                        return None, None
+                    remaining = started + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.count('timeout')
+                        raise PoolTimeoutError(
+                            f'Нет свободного соединения с базой {self.alias} '
+                            f'за {self.timeout} с.'
+                        )
+                    self.condition.wait(remaining)
+        finally:
+            self.close_all(expired)
+
+    def open(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            self.forget()
+            raise
+        self.count('created')
+        self.update_gauges()
+        return connection
+
+    def release(self, connection):
+        try:
+            usable = self.reset(connection)
+        except Exception:
+            usable = False
+        if not usable:
+            self.discard(connection)
+            return
+        with self.condition:
+            expired = self.expire()
+            self.idle.append((connection, time.monotonic()))
+            self.condition.notify()
+        self.close_all(expired)
+        self.update_gauges()
+
+    def usable(self, connection, released):
+        if time.monotonic() - released < self.check_interval:
+            return True
+        self.count('checked')
+        if self.check(connection):
+            return True
+        self.discard(connection)
+        return False
+
+    def discard(self, connection):
+        self.count('discarded')
+        self.close_all([connection])
+        self.forget()
+
+    def forget(self):
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+        self.update_gauges()
+
+    def expire(self):
+        """Убирает из очереди соединения старше max_idle; вызывается
+        под блокировкой, закрываются они после неё."""
+        deadline = time.monotonic() - self.max_idle
+        expired = []
+        while self.idle and self.idle[0][1] < deadline:
+            expired.append(self.idle.popleft()[0])
+        if expired:
+            self.size -= len(expired)
+            self.count('expired', len(expired))
+        return expired
+
+    @staticmethod
+    def close_all(connections):
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def count(self, event, amount=1):
+        with self.condition:
+            self.events[event] += amount
+        POOL_EVENTS.labels(self.alias, event).inc(amount)
+
+    def update_gauges(self):
+        idle = len(self.idle)
+        POOL_CONNECTIONS.labels(self.alias, 'idle').set(idle)
+        POOL_CONNECTIONS.labels(self.alias, 'in_use').set(self.size - idle)
+
+    def stats(self):
+        with self.condition:
+            idle = len(self.idle)
+            return {
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': idle,
+                'in_use': self.size - idle,
+                **self.events,
+            }
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias, key, **options):
+    with pools_lock:
+        if (alias, key) not in pools:
+            pools[alias, key] = ConnectionPool(alias, **options)
+        return pools[alias, key]
+
+
+def get_stats():
+    """Статистика пулов процесса по алиасам баз."""
+    stats = {}
+    for (alias, _), pool in list(pools.items()):
+        for name, value in pool.stats().items():
+            stats.setdefault(alias, {}).setdefault(name, 0)
+            stats[alias][name] += value
+    return stats
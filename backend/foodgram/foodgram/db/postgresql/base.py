@@ -0,0 +1,60 @@
+import functools
+
+import psycopg2
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from ..pool import get_pool
+
+
+def reset(connection):
+    """Откатывает незавершённую транзакцию перед возвратом в пул.
+
+    False означает, что соединение сломано и его нужно закрыть.
+    """
+    status = connection.info.transaction_status
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    return not connection.closed
+
+
+def check(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except psycopg2.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL с пулом соединений процесса.
+
+    Django открывает и закрывает соединение как обычно, но берёт его
+    из пула и возвращает обратно. Пул отдельный для каждого набора
+    параметров подключения и настраивается ключом POOL базы.
+    """
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(
+            self.alias,
+            repr(sorted(conn_params.items())),
+            reset=reset,
+            check=check,
+            **self.settings_dict['POOL'],
+        )
+        connection = self.pool.acquire(
+            functools.partial(super().get_new_connection, conn_params)
+        )
+        self.isolation_level = connection.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
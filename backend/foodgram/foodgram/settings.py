@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -31,6 +32,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.timing.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -70,6 +73,67 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
         'PORT': os.getenv('DB_PORT', default='5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+    },
+}
+
+# Соединение, простоявшее без запросов дольше этого числа секунд,
+# перед использованием проверяется запросом SELECT 1.
+DB_HEALTH_CHECK_INTERVAL = int(
+    os.getenv('DB_HEALTH_CHECK_INTERVAL', default=10)
+)
+
+ASGI = os.getenv('ASGI', default='False').lower() == 'true'
+
+# Пул соединений процесса. Под ASGI каждый запрос выполняется в новом
+# потоке, и сохранённые по CONN_MAX_AGE соединения потоков не используются
+# повторно, а копятся до сборки мусора, поэтому в этом режиме пул включён
+# по умолчанию, а без пула соединения закрываются после запроса.
+DB_POOL = (
+    os.getenv('DB_POOL', default=str(ASGI)).lower() == 'true'
+    and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'
+)
+if DB_POOL:
+    DATABASES['default'].update({
+        'ENGINE': 'foodgram.db.postgresql',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', default=10)),
+            'max_idle': int(os.getenv('DB_POOL_MAX_IDLE', default=300)),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'check_interval': DB_HEALTH_CHECK_INTERVAL,
+        },
+    })
+elif ASGI:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Счётчики и ответы хранятся в кеше, общем для всех воркеров;
+# LocMemCache подходит только для одного процесса. Версии таблиц лежат
+# в отдельном кеше без вытеснения: потерянная версия сбросила бы все
+# ответы, счётчики и ETag по своей таблице.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', default='/tmp/foodgram_cache'
+        ),
+    },
+    'versions': {
+        'BACKEND': os.getenv(
+            'VERSIONS_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'VERSIONS_CACHE_LOCATION', default='/tmp/foodgram_versions'
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('VERSIONS_CACHE_MAX_ENTRIES', default=1000000)
+            ),
+        },
     },
 }
 
@@ -135,6 +199,78 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_VARIANTS_WORKERS = int(os.getenv('IMAGE_VARIANTS_WORKERS', default=2))
+
+FILE_UPLOAD_HANDLERS = [
+    'api.uploads.MaxSizeUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+FILE_UPLOAD_MAX_SIZE = int(
+    os.getenv('FILE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024)
+)
+
+RECIPE_IMAGE_MAX_SIDE = int(os.getenv('RECIPE_IMAGE_MAX_SIDE', default=6000))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 SHOPPING_CART_FILE_NAME = 'shopping_list.txt'
+
+SHOPPING_CART_CHUNK_SIZE = 2000
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+SUBSCRIPTION_RECIPES_LIMIT = int(
+    os.getenv('SUBSCRIPTION_RECIPES_LIMIT', default=10)
+)
+
+INGREDIENT_SEARCH_LIMIT = int(
+    os.getenv('INGREDIENT_SEARCH_LIMIT', default=50)
+)
+
+INGREDIENT_INDEX_MAX_AGE = int(
+    os.getenv('INGREDIENT_INDEX_MAX_AGE', default=300)
+)
+
+RECIPE_BATCH_LIMIT = int(os.getenv('RECIPE_BATCH_LIMIT', default=100))
+
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', default=30))
+
+COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv('COUNT_ESTIMATE_THRESHOLD', default=100000)
+)
+
+RESPONSE_CACHE_TIMEOUT = int(
+    os.getenv('RESPONSE_CACHE_TIMEOUT', default=300)
+)
+
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', default=10))
+
+METRICS = os.getenv('METRICS', default='True').lower() == 'true'
+
+SERVER_TIMING = os.getenv('SERVER_TIMING', default='False').lower() == 'true'
+
+SERVER_TIMING_PROFILE_DIR = os.getenv(
+    'SERVER_TIMING_PROFILE_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'foodgram_profiles')
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,39 @@
+import os
+import shutil
+
+bind = '0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', default=3))
+
+# В режиме ASGI воркер uvicorn держит медленные соединения в цикле событий,
+# а не в отдельном процессе на каждое.
+if os.getenv('ASGI', default='False').lower() == 'true':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+
+# Метрики prometheus_client пишутся каждым воркером в файлы этого каталога
+# и суммируются в /api/metrics. Переменную нужно задать до импорта
+# приложения, поэтому она выставляется в мастер-процессе.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/foodgram_metrics')
+
+
+def on_starting(server):
+    # Версии таблиц в кеше процесса не видны другим воркерам, и они
+    # отдавали бы устаревшие данные.
+    for variable in ('CACHE_BACKEND', 'VERSIONS_CACHE_BACKEND'):
+        cache_backend = os.getenv(variable, default='')
+        if server.cfg.workers > 1 and cache_backend.endswith('LocMemCache'):
+            raise RuntimeError(
+                'LocMemCache нельзя использовать с несколькими воркерами: '
+                f'задайте общий кеш в {variable} или GUNICORN_WORKERS=1.'
+            )
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
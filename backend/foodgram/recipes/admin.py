@@ -1,6 +1,7 @@
 from django.contrib import admin
+from recipes import shopping_list
 from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingList, ShoppingListItem, Tag)
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -29,6 +30,22 @@ class IngredientsInRecipeAdmin(admin.ModelAdmin):
     )
     search_fields = ('recipe__name', 'ingredient__name')
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = [obj.recipe_id]
+        if change:
+            recipe_ids.append(form.initial['recipe'])
+        with shopping_list.tracking_recipes(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with shopping_list.tracking_recipes([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = queryset.values_list('recipe_id', flat=True)
+        with shopping_list.tracking_recipes(recipe_ids):
+            super().delete_queryset(request, queryset)
+
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = (
@@ -57,6 +74,10 @@ class RecipeAdmin(admin.ModelAdmin):
     def is_favorited(self, instance):
         return instance.favorite_recipes.count()
 
+    def save_related(self, request, form, formsets, change):
+        with shopping_list.tracking_recipes([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
 
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = (
@@ -84,6 +105,27 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     )
 
 
+class ShoppingListItemInline(admin.TabularInline):
+    model = ShoppingListItem
+    extra = 0
+    readonly_fields = ('ingredient', 'amount')
+
+
+class ShoppingListAdmin(admin.ModelAdmin):
+    inlines = (ShoppingListItemInline,)
+    list_display = (
+        'pk',
+        'user',
+        'version',
+        'updated'
+    )
+    search_fields = (
+        'user__username',
+        'user__email'
+    )
+    readonly_fields = ('version',)
+
+
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
@@ -93,3 +135,4 @@ admin.site.register(
     IngredientsInRecipe,
     IngredientsInRecipeAdmin
 )
+admin.site.register(ShoppingList, ShoppingListAdmin)
@@ -0,0 +1,138 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+
+from .storage import lock_name
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants'
+VARIANTS = {
+    'thumbnail': ((480, 480), 'JPEG', 'jpg'),
+    'thumbnail_webp': ((480, 480), 'WEBP', 'webp'),
+    'detail': ((1200, 1200), 'JPEG', 'jpg'),
+    'detail_webp': ((1200, 1200), 'WEBP', 'webp'),
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANTS_WORKERS,
+    thread_name_prefix='image-variants',
+)
+pending = set()
+pending_lock = threading.Lock()
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail(size)
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(buffer, format=image_format, quality=85)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_variants(recipe):
+    """Сохраняет уменьшенные копии и WebP изображения рецепта."""
+    field = recipe.image
+    stem = PurePosixPath(field.name).stem
+    variants = {'source': field.name}
+    with field.open('rb') as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        for name, (size, image_format, extension) in VARIANTS.items():
+            variants[name] = field.storage.save(
+                f'{VARIANTS_DIR}/{stem}_{name}.{extension}',
+                render_variant(image, size, image_format),
+            )
+    return variants
+
+
+def build_variants(recipe_id, image_name):
+    from .models import Recipe
+
+    close_old_connections()
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id, image=image_name).first()
+        if recipe is None or not variants_outdated(recipe):
+            return
+        recipe.image_variants = shared_variants(recipe) or generate_variants(
+            recipe
+        )
+        recipe.save(update_fields=('image_variants',))
+    except Exception:
+        logger.exception('Не удалось подготовить изображения рецепта %s',
+                         recipe_id)
+    finally:
+        connection.close()
+        with pending_lock:
+            pending.discard((recipe_id, image_name))
+
+
+def submit_variants(recipe_id, image_name):
+    with pending_lock:
+        if (recipe_id, image_name) in pending:
+            return
+        pending.add((recipe_id, image_name))
+    executor.submit(build_variants, recipe_id, image_name)
+
+
+def schedule_variants(recipe):
+    """Ставит генерацию копий в фоновый поток после коммита транзакции,
+    чтобы запрос не ждал обработки изображения."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(lambda: submit_variants(recipe_id, image_name))
+
+
+def shared_variants(recipe):
+    """Копии, уже готовые у другого рецепта с тем же файлом."""
+    from .models import Recipe
+
+    return Recipe.objects.filter(
+        image=recipe.image.name,
+        image_variants__source=recipe.image.name,
+        image_variants__has_keys=list(VARIANTS),
+    ).exclude(pk=recipe.pk).values_list('image_variants', flat=True).first()
+
+
+@transaction.atomic
+def release_files(image_name, variants):
+    """Удаляет файл изображения и его копии, если на него больше не
+    ссылается ни один рецепт.
+
+    Проверка ссылок и удаление идут под блокировкой имени файла, которую
+    держит до коммита и транзакция, сохраняющая рецепт с этим файлом.
+    """
+    from .models import Recipe
+
+    if not image_name:
+        return
+    lock_name(image_name)
+    if Recipe.objects.filter(image=image_name).exists():
+        return
+    storage = Recipe._meta.get_field('image').storage
+    names = {image_name}
+    if variants and variants.get('source') == image_name:
+        names.update(variants[name] for name in VARIANTS if name in variants)
+    for name in names:
+        storage.delete(name)
+
+
+def schedule_release(image_name, variants):
+    transaction.on_commit(lambda: release_files(image_name, variants))
+
+
+def variants_outdated(recipe):
+    """Копии сделаны для другого файла или среди них нет какой-то из
+    VARIANTS, например добавленной позже."""
+    variants = recipe.image_variants
+    return bool(recipe.image) and (
+        variants.get('source') != recipe.image.name
+        or any(name not in variants for name in VARIANTS)
+    )
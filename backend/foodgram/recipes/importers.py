@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from api import versions
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+JSON_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = ' \t\r\n[],'
+
+
+def read_csv(file, fields):
+    for row in csv.reader(file):
+        if row:
+            yield dict(zip(fields, (value.strip() for value in row)))
+
+
+def read_json(file, fields):
+    """Потоково читает JSON-массив объектов или JSON Lines, не загружая
+    файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip(JSON_SEPARATORS)
+            if not buffer:
+                break
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if not chunk:
+                    raise
+                break
+            buffer = buffer[end:]
+            yield {field: str(item[field]).strip() for field in fields}
+        if not chunk:
+            return
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def upsert(model, rows, key, fields):
+    """Добавляет новые строки и обновляет изменившиеся.
+
+    Возвращает число добавленных и обновлённых строк.
+    """
+    rows = list({row[key]: row for row in rows}.values())
+    if connection.vendor == 'postgresql':
+        return copy_upsert(model, rows, key, fields)
+    return orm_upsert(model, rows, key, fields)
+
+
+def orm_upsert(model, rows, key, fields):
+    existing = model.objects.in_bulk(
+        [row[key] for row in rows], field_name=key
+    )
+    created = []
+    updated = []
+    for row in rows:
+        obj = existing.get(row[key])
+        if obj is None:
+            created.append(model(**row))
+        elif any(getattr(obj, field) != row[field] for field in fields):
+            for field in fields:
+                setattr(obj, field, row[field])
+            updated.append(obj)
+    model.objects.bulk_create(created, ignore_conflicts=True)
+    model.objects.bulk_update(
+        updated, [field for field in fields if field != key]
+    )
+    return len(created), len(updated)
+
+
+def copy_upsert(model, rows, key, fields):
+    """Загружает пачку через COPY во временную таблицу и переносит её
+    одним INSERT ... ON CONFLICT."""
+    quote = connection.ops.quote_name
+    table = model._meta.db_table
+    staging = quote(f'import_staging_{table}')
+    columns = [quote(model._meta.get_field(field).column) for field in fields]
+    column_list = ', '.join(columns)
+    key_column = quote(model._meta.get_field(key).column)
+    updates = [column for column in columns if column != key_column]
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [row[field] for field in fields] for row in rows
+    )
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE IF NOT EXISTS {staging} AS '
+            f'SELECT {column_list} FROM {quote(table)} WITH NO DATA'
+        )
+        cursor.copy_expert(
+            f'COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)',
+            buffer,
+        )
+        cursor.execute(
+            f'INSERT INTO {quote(table)} AS target ({column_list}) '
+            f'SELECT {column_list} FROM {staging} '
+            f'ON CONFLICT ({key_column}) DO UPDATE SET '
+            + ', '.join(f'{column} = EXCLUDED.{column}' for column in updates)
+            + ' WHERE ('
+            + ', '.join(f'target.{column}' for column in updates)
+            + ') IS DISTINCT FROM ('
+            + ', '.join(f'EXCLUDED.{column}' for column in updates)
+            + ') RETURNING (xmax = 0)'
+        )
+        inserted = [row[0] for row in cursor.fetchall()]
+        cursor.execute(f'TRUNCATE {staging}')
+    return inserted.count(True), inserted.count(False)
+
+
+class ImportCommand(BaseCommand):
+    """Потоковая идемпотентная загрузка справочника из CSV или JSON."""
+    model = None
+    key = None
+    fields = ()
+    default_file = None
+    success_message = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=str(Path(settings.BASE_DIR) / 'data' / self.default_file),
+            help='Путь к файлу с данными.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=tuple(READERS),
+            help='Формат файла, по умолчанию — по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Число строк в одной пачке.'
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        try:
+            with path.open(encoding='UTF-8', newline='') as file:
+                created, updated = self.load(
+                    READERS[file_format](file, self.fields),
+                    options['batch_size'],
+                )
+        except OSError as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+        except (KeyError, ValueError) as error:
+            raise CommandError(f'Ошибка в данных {path}: {error!r}')
+        if created or updated:
+            versions.mark_changed([self.model._meta.db_table])
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.success_message} Добавлено: {created}, '
+            f'обновлено: {updated}.'
+        ))
+
+    def load(self, rows, batch_size):
+        started = time.monotonic()
+        total = created = updated = 0
+        for batch in batched(rows, batch_size):
+            with transaction.atomic():
+                batch_created, batch_updated = upsert(
+                    self.model, batch, self.key, self.fields
+                )
+            total += len(batch)
+            created += batch_created
+            updated += batch_updated
+            elapsed = max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'Обработано строк: {total} ({total / elapsed:.0f} в секунду)'
+            )
+        return created, updated
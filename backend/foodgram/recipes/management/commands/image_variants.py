@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Image variants generator."""
+    help = 'Подготовить уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии и для рецептов, где они уже есть.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        for recipe in recipes.iterator():
+            if options['all'] or images.variants_outdated(recipe):
+                recipe.image_variants = images.generate_variants(recipe)
+                recipe.save(update_fields=('image_variants',))
+        self.stdout.write(self.style.SUCCESS('Изображения подготовлены!'))
@@ -1,31 +1,12 @@
-from csv import reader
-
-from django.core.management.base import BaseCommand
+from recipes.importers import ImportCommand
 from recipes.models import Ingredient
 
 
-class Command(BaseCommand):
+class Command(ImportCommand):
     """Ingredients loader."""
-    help = "Load ingredients from csv file (should be in '/backend/data')."
-
-    def handle(self, *args, **kwargs):
-        ingredient_list = []
-        with open(
-            'data/ingredients.csv',
-            'r',
-            encoding='UTF-8',
-            newline=''
-        ) as file:
-            csv_reader = reader(file)
-
-            for row in csv_reader:
-                name = row[0]
-                measurement_unit = row[1]
-                ingredient = Ingredient(
-                    name=name,
-                    measurement_unit=measurement_unit
-                )
-                ingredient_list.append(ingredient)
-        Ingredient.objects.bulk_create(ingredient_list)
-
-        self.stdout.write(self.style.SUCCESS('Ингредиенты загружены!'))
+    help = 'Загрузить ингредиенты из CSV или JSON (по умолчанию data/).'
+    model = Ingredient
+    key = 'name'
+    fields = ('name', 'measurement_unit')
+    default_file = 'ingredients.csv'
+    success_message = 'Ингредиенты загружены!'
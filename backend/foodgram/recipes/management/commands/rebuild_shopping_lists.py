@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from recipes import shopping_list
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Shopping lists rebuilder."""
+    help = 'Пересчитать сводные списки покупок по корзинам пользователей.'
+
+    def handle(self, *args, **kwargs):
+        # Пользователь с пустой корзиной, но старым списком тоже
+        # пересчитывается — его список очищается.
+        users = User.objects.filter(
+            Q(shopping_cart__isnull=False) | Q(shopping_list__isnull=False)
+        ).distinct()
+        for user in users.iterator():
+            shopping_list.rebuild(user)
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны!'))
@@ -0,0 +1,210 @@
+import random
+from io import BytesIO
+from itertools import accumulate
+
+from api import versions
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from PIL import Image
+from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from users.models import Subscription
+
+User = get_user_model()
+
+USERNAME_PREFIX = 'seed_'
+SEED_PASSWORD = 'seed-password'
+BATCH_SIZE = 2000
+WORDS = (
+    'суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'паста', 'плов',
+    'борщ', 'омлет', 'блины', 'котлеты', 'жаркое', 'десерт', 'соус',
+)
+
+
+class Skewed:
+    """Выбор с распределением Ципфа: первые элементы популярнее."""
+
+    def __init__(self, items, rng, exponent=1.1):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.rng = rng
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+
+    def sample(self, count, exclude=None):
+        count = min(count, len(self.items) - (exclude is not None))
+        chosen = set()
+        while len(chosen) < count:
+            item = self.rng.choices(
+                self.items, cum_weights=self.cum_weights
+            )[0]
+            if item != exclude:
+                chosen.add(item)
+        return chosen
+
+
+class Command(BaseCommand):
+    """Synthetic data generator."""
+    help = ('Заполнить базу синтетическими пользователями, рецептами, '
+            'подписками, избранным и корзинами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='Среднее число подписок на пользователя.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число избранных рецептов на пользователя.'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в корзине пользователя.'
+        )
+        parser.add_argument('--images', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее созданные синтетические данные.'
+        )
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        if not ingredient_ids or not tag_ids:
+            raise CommandError(
+                'Сначала загрузите ингредиенты и тэги: '
+                'ingredients_import, tags_import.'
+            )
+        rng = random.Random(options['seed'])
+        users = self.create_users(options['users'])
+        if not users:
+            raise CommandError('Нужен хотя бы один пользователь: --users.')
+        recipes = self.create_recipes(
+            rng, users, options['recipes'], options['images']
+        )
+        self.create_recipe_relations(rng, recipes, ingredient_ids, tag_ids)
+        authors = Skewed(users, rng)
+        self.create_links(rng, Subscription, 'author', users, authors,
+                          options['subscriptions'])
+        popular = Skewed(recipes, rng)
+        self.create_links(rng, Favorite, 'recipe', users, popular,
+                          options['favorites'])
+        self.create_links(rng, ShoppingCart, 'recipe', users, popular,
+                          options['cart'])
+        call_command('rebuild_shopping_lists', stdout=self.stdout)
+        versions.bump(versions.tracked_tables())
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}. '
+            f'Пароль пользователей {USERNAME_PREFIX}*: {SEED_PASSWORD}'
+        ))
+
+    def create_users(self, count):
+        last_pk = User.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        start = User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).count()
+        password = make_password(SEED_PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{USERNAME_PREFIX}{number}',
+                    email=f'{USERNAME_PREFIX}{number}@example.com',
+                    first_name=f'Имя{number}',
+                    last_name=f'Фамилия{number}',
+                    password=password,
+                )
+                for number in range(start, start + count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        return list(User.objects.filter(
+            pk__gt=last_pk, username__startswith=USERNAME_PREFIX
+        ).values_list('pk', flat=True))
+
+    def create_recipes(self, rng, users, count, image_count):
+        last_pk = Recipe.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+        images = [self.make_image(rng) for _ in range(max(image_count, 1))]
+        authors = Skewed(users, rng)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=authors.sample(1).pop(),
+                    name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                    text=' '.join(rng.choices(WORDS, k=40)),
+                    cooking_time=rng.randint(5, 180),
+                    image=rng.choice(images),
+                )
+                for _ in range(count)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        return list(Recipe.objects.filter(
+            pk__gt=last_pk
+        ).values_list('pk', flat=True))
+
+    @staticmethod
+    def make_image(rng):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        buffer = BytesIO()
+        Image.new('RGB', (1600, 1200), color).save(buffer, format='JPEG')
+        return Recipe._meta.get_field('image').storage.save(
+            'recipes/images/seed.jpg', ContentFile(buffer.getvalue())
+        )
+
+    @staticmethod
+    def create_recipe_relations(rng, recipe_ids, ingredient_ids, tag_ids):
+        ingredients = Skewed(ingredient_ids, rng, exponent=0.8)
+        IngredientsInRecipe.objects.bulk_create(
+            (
+                IngredientsInRecipe(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for recipe_id in recipe_ids
+                for ingredient_id in ingredients.sample(rng.randint(3, 12))
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipe_ids
+                for tag_id in rng.sample(
+                    tag_ids, rng.randint(1, min(3, len(tag_ids)))
+                )
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def create_links(rng, model, field, users, targets, average):
+        """Связи пользователей с авторами или рецептами: число связей
+        у пользователя распределено экспоненциально вокруг среднего."""
+        if not average:
+            return
+        model.objects.bulk_create(
+            (
+                model(user_id=user_id, **{f'{field}_id': target_id})
+                for user_id in users
+                for target_id in targets.sample(
+                    int(rng.expovariate(1 / average)),
+                    exclude=user_id if field == 'author' else None,
+                )
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
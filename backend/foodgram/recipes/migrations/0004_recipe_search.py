@@ -0,0 +1,96 @@
+from django.db import migrations
+
+POSTGRESQL_FORWARD = (
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION recipes_recipe_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A')
+            || setweight(to_tsvector('russian', coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_vector_update()
+    """,
+    'UPDATE recipes_recipe SET name = name',
+    """
+    CREATE INDEX recipes_recipe_search_vector_idx
+    ON recipes_recipe USING GIN (search_vector)
+    """,
+)
+
+POSTGRESQL_BACKWARD = (
+    'DROP TRIGGER recipes_recipe_search_vector_trigger ON recipes_recipe',
+    'DROP FUNCTION recipes_recipe_search_vector_update()',
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+)
+
+SQLITE_FORWARD = (
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, content='recipes_recipe', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_insert AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_delete AFTER DELETE ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        INSERT INTO recipes_recipe_fts(recipes_recipe_fts, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO recipes_recipe_fts(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    "INSERT INTO recipes_recipe_fts(recipes_recipe_fts) VALUES ('rebuild')",
+)
+
+SQLITE_BACKWARD = (
+    'DROP TRIGGER recipes_recipe_fts_insert',
+    'DROP TRIGGER recipes_recipe_fts_delete',
+    'DROP TRIGGER recipes_recipe_fts_update',
+    'DROP TABLE recipes_recipe_fts',
+)
+
+
+def run_statements(postgresql, sqlite):
+    def run(apps, schema_editor):
+        statements = {
+            'postgresql': postgresql,
+            'sqlite': sqlite,
+        }.get(schema_editor.connection.vendor, ())
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_auto_20230526_1613'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements(POSTGRESQL_FORWARD, SQLITE_FORWARD),
+            run_statements(POSTGRESQL_BACKWARD, SQLITE_BACKWARD),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 16:51
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, help_text='Загрузите изображение блюда', storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images', verbose_name='Изображение'),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -53,6 +56,40 @@ class Ingredient(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """Подгружает автора, теги и ингредиенты фиксированным числом
+        запросов."""
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredients_in_recipe',
+                queryset=IngredientsInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты флагами is_favorited и is_in_shopping_cart."""
+        if user is None or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+        )
+
+
 class Recipe(models.Model):
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -94,14 +131,24 @@ class Recipe(models.Model):
         blank=True,
         verbose_name='Изображение',
         upload_to='recipes/images',
+        storage=ContentAddressedStorage(),
+        db_index=True,
         help_text='Загрузите изображение блюда'
     )
+    image_variants = models.JSONField(
+        verbose_name='Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     pub_date = models.DateTimeField(
         verbose_name='Дата добавления',
         auto_now_add=True,
         db_index=True
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
@@ -110,6 +157,16 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминает загруженное изображение, чтобы после его замены
+        освободить старый файл."""
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance.loaded_image = loaded.get('image')
+        instance.loaded_variants = loaded.get('image_variants')
+        return instance
+
 
 class IngredientsInRecipe(models.Model):
     recipe = models.ForeignKey(
@@ -203,3 +260,60 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в список покупок'
+
+
+class ShoppingList(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь списка покупок'
+    )
+    version = models.PositiveIntegerField(
+        verbose_name='Версия',
+        default=0
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
+
+    class Meta:
+        verbose_name = 'Сводный список покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+        ordering = ('user',)
+
+    def __str__(self):
+        return f'Список покупок {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    shopping_list = models.ForeignKey(
+        ShoppingList,
+        on_delete=models.CASCADE,
+        related_name='items',
+        verbose_name='Список покупок'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        constraints = (
+            models.UniqueConstraint(
+                fields=('shopping_list', 'ingredient'),
+                name='unique_shopping_list_item'
+            ),
+        )
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+        ordering = ('shopping_list', 'ingredient')
+
+    def __str__(self):
+        return f'{self.ingredient} - {self.amount}'
@@ -0,0 +1,111 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+
+SQLITE_TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON recipes_recipe
+    BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON recipes_recipe
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON recipes_recipe
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END
+    """,
+)
+
+
+def restore_sqlite_triggers(using, **kwargs):
+    """Восстанавливает триггеры FTS5 после миграций.
+
+    SQLite изменяет таблицу рецептов пересозданием, и триггеры,
+    созданные миграцией 0004, при этом теряются.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if FTS_TABLE not in connection.introspection.table_names(cursor):
+            return
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master "
+            "WHERE type = 'trigger' AND tbl_name = 'recipes_recipe'"
+        )
+        if cursor.fetchone()[0] >= len(SQLITE_TRIGGERS):
+            return
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+
+
+def search_recipes(queryset, query):
+    """Полнотекстовый поиск рецептов по названию и тексту.
+
+    Результат аннотируется полем search_rank и упорядочивается по нему.
+    PostgreSQL ищет по колонке search_vector с GIN-индексом, SQLite —
+    по таблице FTS5; обе поддерживаются триггерами из миграции.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = 'plainto_tsquery(%s::regconfig, %s)'
+        params = (SEARCH_CONFIG, ' '.join(words))
+        match = RawSQL(
+            f'"{table}"."search_vector" @@ {tsquery}',
+            params,
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f'ts_rank("{table}"."search_vector", {tsquery})',
+            params,
+            output_field=FloatField(),
+        )
+    elif vendor == 'sqlite':
+        params = (' '.join(f'"{word}"*' for word in words),)
+        match = RawSQL(
+            f'"{table}"."id" IN (SELECT rowid FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s)',
+            params,
+            output_field=BooleanField(),
+        )
+        rank = RawSQL(
+            f'(SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id")',
+            params,
+            output_field=FloatField(),
+        )
+    else:
+        match = Q()
+        for word in words:
+            match &= Q(name__icontains=word) | Q(text__icontains=word)
+        rank = Value(0.0, output_field=FloatField())
+    return queryset.filter(match).annotate(
+        search_rank=rank
+    ).order_by('-search_rank', '-pub_date')
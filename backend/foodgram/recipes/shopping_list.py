@@ -0,0 +1,205 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (IngredientsInRecipe, Recipe, ShoppingCart, ShoppingList,
+                     ShoppingListItem)
+
+pending_changes = ContextVar('pending_shopping_list_changes', default=None)
+
+
+def lock_recipes(recipe_ids):
+    """Блокирует строки рецептов до конца транзакции.
+
+    Изменение корзины и изменение ингредиентов рецепта блокируют рецепт
+    до чтения его ингредиентов, поэтому одно из них дожидается коммита
+    другого: иначе список покупок собирался бы по старым количествам,
+    а обновление рецепта не видело бы новую строку корзины.
+    """
+    list(Recipe.objects.select_for_update().filter(
+        pk__in=recipe_ids
+    ).order_by('pk').values_list('pk', flat=True))
+
+
+@transaction.atomic(savepoint=False)
+def recipe_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    lock_recipes(recipe_ids)
+    amounts = Counter()
+    rows = IngredientsInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', 'amount')
+    for ingredient_id, amount in rows:
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+@transaction.atomic
+def apply_delta(user_ids, delta, create=True):
+    """Прибавляет delta ({ingredient_id: количество}) к спискам покупок
+    пользователей и увеличивает их версию.
+
+    Строки списков блокируются, поэтому параллельные изменения корзины
+    одного пользователя применяются последовательно.
+    """
+    delta = {key: value for key, value in delta.items() if value}
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+    if create:
+        ShoppingList.objects.bulk_create(
+            (ShoppingList(user_id=user_id) for user_id in user_ids),
+            ignore_conflicts=True,
+        )
+    list_ids = list(ShoppingList.objects.select_for_update().filter(
+        user_id__in=user_ids
+    ).order_by('pk').values_list('pk', flat=True))
+    if delta:
+        items = {
+            (item.shopping_list_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                shopping_list_id__in=list_ids, ingredient_id__in=delta
+            )
+        }
+        to_create, to_update, to_delete = [], [], []
+        for list_id in list_ids:
+            for ingredient_id, change in delta.items():
+                item = items.get((list_id, ingredient_id))
+                amount = (item.amount if item else 0) + change
+                if item is None and amount > 0:
+                    to_create.append(ShoppingListItem(
+                        shopping_list_id=list_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    ))
+                elif item is not None and amount > 0:
+                    item.amount = amount
+                    to_update.append(item)
+                elif item is not None:
+                    to_delete.append(item.pk)
+        ShoppingListItem.objects.bulk_create(to_create)
+        ShoppingListItem.objects.bulk_update(to_update, ('amount',))
+        ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+    ShoppingList.objects.filter(pk__in=list_ids).update(
+        version=F('version') + 1, updated=timezone.now()
+    )
+
+
+class PendingChanges:
+    """Изменения списков покупок, накопленные внутри deferred()."""
+
+    def __init__(self):
+        self.amounts = {}
+        self.deltas = defaultdict(Counter)
+
+    def recipe_amounts(self, recipe_ids):
+        missing = [pk for pk in recipe_ids if pk not in self.amounts]
+        if missing:
+            for pk in missing:
+                self.amounts[pk] = Counter()
+            lock_recipes(missing)
+            rows = IngredientsInRecipe.objects.filter(
+                recipe_id__in=missing
+            ).values_list('recipe_id', 'ingredient_id', 'amount')
+            for recipe_id, ingredient_id, amount in rows:
+                self.amounts[recipe_id][ingredient_id] += amount
+        amounts = Counter()
+        for pk in recipe_ids:
+            amounts.update(self.amounts[pk])
+        return amounts
+
+    def apply(self):
+        groups = defaultdict(list)
+        for user_id, delta in self.deltas.items():
+            key = frozenset(item for item in delta.items() if item[1])
+            if key:
+                groups[key].append(user_id)
+        for key, user_ids in groups.items():
+            delta = dict(key)
+            apply_delta(
+                user_ids, delta, create=any(v > 0 for v in delta.values())
+            )
+
+
+@contextmanager
+def deferred():
+    """Копит изменения списков покупок внутри блока и применяет их при
+    выходе. Одинаковые изменения разных пользователей, например при
+    удалении рецепта из всех корзин, применяются одним apply_delta."""
+    changes = PendingChanges()
+    token = pending_changes.set(changes)
+    try:
+        yield changes
+    finally:
+        pending_changes.reset(token)
+    changes.apply()
+
+
+def change_user_recipes(user_id, recipe_ids, sign):
+    changes = pending_changes.get()
+    if changes is None:
+        amounts = recipe_amounts(recipe_ids)
+    else:
+        amounts = changes.recipe_amounts(recipe_ids)
+    delta = {key: sign * value for key, value in amounts.items()}
+    if changes is None:
+        apply_delta([user_id], delta, create=sign > 0)
+    else:
+        changes.deltas[user_id].update(delta)
+
+
+def add_recipes(user_id, recipe_ids):
+    change_user_recipes(user_id, recipe_ids, 1)
+
+
+def remove_recipes(user_id, recipe_ids):
+    change_user_recipes(user_id, recipe_ids, -1)
+
+
+def change_recipe(recipe, old_amounts, new_amounts):
+    """Переносит изменение ингредиентов рецепта в списки покупок всех,
+    у кого он в корзине."""
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    if not any(delta.values()):
+        return
+    user_ids = ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True)
+    apply_delta(user_ids, delta)
+
+
+@contextmanager
+def tracking_recipes(recipe_ids):
+    """Переносит в списки покупок изменения ингредиентов рецептов,
+    сделанные внутри блока в обход сериализатора, например в админке."""
+    with transaction.atomic():
+        old_amounts = {pk: recipe_amounts([pk]) for pk in set(recipe_ids)}
+        yield
+        for pk, amounts in old_amounts.items():
+            change_recipe(pk, amounts, recipe_amounts([pk]))
+
+
+@transaction.atomic
+def rebuild(user):
+    """Пересчитывает список покупок пользователя по корзине целиком."""
+    shopping_list, _ = ShoppingList.objects.get_or_create(user=user)
+    shopping_list.items.all().delete()
+    amounts = recipe_amounts(
+        user.shopping_cart.values_list('recipe_id', flat=True)
+    )
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(
+            shopping_list=shopping_list,
+            ingredient_id=ingredient_id,
+            amount=amount,
+        )
+        for ingredient_id, amount in amounts.items()
+    )
+    ShoppingList.objects.filter(pk=shopping_list.pk).update(
+        version=F('version') + 1, updated=timezone.now()
+    )
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import images, shopping_list
+from .models import Recipe, ShoppingCart
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_variants(sender, instance, **kwargs):
+    if images.variants_outdated(instance):
+        images.schedule_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def release_replaced_image(sender, instance, **kwargs):
+    loaded_image = getattr(instance, 'loaded_image', None)
+    if loaded_image is None:
+        return
+    if loaded_image != instance.image.name:
+        images.schedule_release(loaded_image, instance.loaded_variants)
+    instance.loaded_image = instance.image.name
+    instance.loaded_variants = instance.image_variants
+
+
+@receiver(post_delete, sender=Recipe)
+def release_deleted_image(sender, instance, **kwargs):
+    images.schedule_release(instance.image.name, instance.image_variants)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_list(sender, instance, **kwargs):
+    shopping_list.remove_recipes(instance.user_id, [instance.recipe_id])
@@ -0,0 +1,57 @@
+import hashlib
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+
+def lock_name(name):
+    """Блокирует имя файла до конца текущей транзакции.
+
+    Сохранение, переиспользующее существующий блоб, и его удаление
+    берут одну и ту же блокировку, поэтому удаление дожидается коммита
+    транзакции, сославшейся на блоб, и видит новую ссылку. Работает
+    на PostgreSQL через advisory lock, на других базах ничего не делает.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    key = int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по sha256 содержимого.
+
+    Одинаковые файлы сохраняются один раз: если блоб с таким хэшем уже
+    есть, запись пропускается и возвращается имя существующего файла.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        lock_name(name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    @staticmethod
+    def hashed_name(name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(
+            directory, hexdigest[:2], f'{hexdigest}{extension}'
+        )
@@ -1,18 +1,113 @@
+import csv
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
 
+FOOTER = 'FoodGram At Your Service'
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+STREAM_CHUNK_SIZE = 64 * 1024
 
-def convert_txt(shop_list):
-    file_name = settings.SHOPPING_CART_FILE_NAME
-    lines = []
-    for ing in shop_list:
-        name = ing['ingredient__name']
-        measurement_unit = ing['ingredient__measurement_unit']
-        amount = ing['ingredient_total']
-        lines.append(f'{name} ({measurement_unit}) - {amount}')
-    lines.append('\nFoodGram At Your Service')
-    content = '\n'.join(lines)
-    content_type = 'text/plain'
-    response = HttpResponse(content, content_type=content_type)
+
+def shopping_list_rows(shop_list):
+    chunk_size = settings.SHOPPING_CART_CHUNK_SIZE
+    for ing in shop_list.iterator(chunk_size=chunk_size):
+        yield (
+            ing['ingredient__name'],
+            ing['ingredient__measurement_unit'],
+            ing['ingredient_total'],
+        )
+
+
+def txt_lines(shop_list):
+    for name, measurement_unit, amount in shopping_list_rows(shop_list):
+        yield f'{name} ({measurement_unit}) - {amount}\n'
+    yield f'\n{FOOTER}'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(shop_list):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in shopping_list_rows(shop_list):
+        yield writer.writerow(row)
+
+
+def get_pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    font_path = settings.SHOPPING_CART_PDF_FONT
+    if not font_path or not Path(font_path).exists():
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, font_path))
+    return PDF_FONT_NAME
+
+
+def pdf_chunks(shop_list):
+    """Строит PDF во временном файле, который переносится на диск
+    при превышении STREAM_CHUNK_SIZE, и отдаёт его частями.
+
+    В отличие от TXT и CSV, PDF не потоковый: reportlab держит все
+    страницы в памяти до save(), и первая часть отдаётся только после
+    чтения всего списка. Размер документа ограничен числом ингредиентов
+    в справочнике — по строке на ингредиент.
+    """
+    with SpooledTemporaryFile(max_size=STREAM_CHUNK_SIZE) as file:
+        font = get_pdf_font()
+        width, height = A4
+        pdf = canvas.Canvas(file, pagesize=A4)
+        pdf.setFont(font, PDF_FONT_SIZE)
+        y = height - PDF_MARGIN
+        for line in txt_lines(shop_list):
+            if y < PDF_MARGIN:
+                pdf.showPage()
+                pdf.setFont(font, PDF_FONT_SIZE)
+                y = height - PDF_MARGIN
+            pdf.drawString(PDF_MARGIN, y, line.strip())
+            y -= PDF_FONT_SIZE * 1.5
+        pdf.save()
+        file.seek(0)
+        yield from iter(lambda: file.read(STREAM_CHUNK_SIZE), b'')
+
+
+def streaming_response(content, content_type, extension):
+    file_name = Path(settings.SHOPPING_CART_FILE_NAME).with_suffix(extension)
+    response = StreamingHttpResponse(content, content_type=content_type)
     response['Content-Disposition'] = f'attachment; filename={file_name}'
     return response
+
+
+def convert_txt(shop_list):
+    return streaming_response(
+        txt_lines(shop_list), 'text/plain; charset=utf-8', '.txt'
+    )
+
+
+def convert_csv(shop_list):
+    return streaming_response(
+        csv_lines(shop_list), 'text/csv; charset=utf-8', '.csv'
+    )
+
+
+def convert_pdf(shop_list):
+    return streaming_response(
+        pdf_chunks(shop_list), 'application/pdf', '.pdf'
+    )
+
+
+SHOPPING_LIST_CONVERTERS = {
+    'txt': convert_txt,
+    'csv': convert_csv,
+    'pdf': convert_pdf,
+}
@@ -0,0 +1,198 @@
+import re
+import traceback
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection
+from recipes import shopping_list
+from recipes.models import (Favorite, Ingredient, IngredientsInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from rest_framework.test import APIClient
+from users.models import Subscription
+
+User = get_user_model()
+
+PASSWORD = 'Foodgram-test-1'
+PROJECT_DIR = str(settings.BASE_DIR)
+TESTS_DIR = str(Path(__file__).resolve().parent)
+PLACEHOLDERS = re.compile(r'\(%s(?:, %s)*\)')
+ROWS = re.compile(r'\(\.\.\.\)(?:, \(\.\.\.\))+')
+
+
+def normalize(sql):
+    """SQL без зависимости от длины списков IN (...) и VALUES."""
+    return ROWS.sub('(...)', PLACEHOLDERS.sub('(...)', sql))
+
+
+class QueryRecorder:
+    """Записывает SQL-запросы вместе со стеком вызовов из кода проекта."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        stack = [
+            frame for frame in traceback.extract_stack()[:-1]
+            if frame.filename.startswith(PROJECT_DIR)
+            and not frame.filename.startswith(TESTS_DIR)
+            and 'site-packages' not in frame.filename
+        ]
+        self.queries.append(
+            (normalize(sql), ''.join(traceback.format_list(stack)))
+        )
+        return execute(sql, params, many, context)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def templates(self):
+        return Counter(sql for sql, _ in self.queries)
+
+    def report(self, baseline=None):
+        """Запросы, число которых выросло по сравнению с baseline, или все
+        запросы, если baseline не задан."""
+        grown = self.templates()
+        if baseline is not None:
+            grown.subtract(baseline.templates())
+        lines = []
+        seen = set()
+        for sql, stack in self.queries:
+            if grown[sql] <= 0 or sql in seen:
+                continue
+            seen.add(sql)
+            lines.append(f'+{grown[sql]} x {sql}\n{stack}')
+        return '\n'.join(lines)
+
+
+@pytest.fixture(autouse=True)
+def isolated(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    cache.clear()
+    caches['versions'].clear()
+    yield
+    cache.clear()
+    caches['versions'].clear()
+
+
+@pytest.fixture
+def record_queries():
+    def record(call):
+        cache.clear()
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = call()
+            # Потоковый ответ выполняет запросы, пока его читают.
+            if response.streaming:
+                response.body = b''.join(response.streaming_content)
+            else:
+                response.body = response.content
+        return response, recorder
+    return record
+
+
+@pytest.fixture
+def client_for():
+    def make(user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        return client
+    return make
+
+
+def create_user(name):
+    return User.objects.create_user(
+        username=name,
+        email=f'{name}@example.com',
+        password=PASSWORD,
+        first_name=f'Имя {name}',
+        last_name=f'Фамилия {name}',
+    )
+
+
+def create_recipe(author, name, tags, ingredients):
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text='Описание',
+        cooking_time=10,
+        image='recipes/images/test.png',
+    )
+    recipe.tags.set(tags)
+    IngredientsInRecipe.objects.bulk_create(
+        IngredientsInRecipe(recipe=recipe, ingredient=ingredient, amount=5)
+        for ingredient in ingredients
+    )
+    return recipe
+
+
+def build_world(size):
+    """Данные, где число авторов, рецептов, ингредиентов, подписок,
+    избранного и корзин растёт вместе с size."""
+    tags = [
+        Tag.objects.create(
+            name=f'Тэг {size}-{number}',
+            color='#E26C2D',
+            slug=f'tag-{size}-{number}',
+        )
+        for number in range(2)
+    ]
+    ingredients = [
+        Ingredient.objects.create(
+            name=f'продукт {size}-{number}', measurement_unit='г'
+        )
+        for number in range(size)
+    ]
+    me = create_user(f'me-{size}')
+    authors = [
+        create_user(f'author-{size}-{number}') for number in range(size)
+    ]
+    recipes = [
+        create_recipe(
+            author, f'Рецепт {size}-{author.pk}-{number}', tags, ingredients
+        )
+        for author in authors
+        for number in range(size)
+    ]
+    fresh = [
+        create_recipe(authors[0], f'Новый {size}-{number}', tags, ingredients)
+        for number in range(size)
+    ]
+    own = create_recipe(me, f'Мой рецепт {size}', tags, ingredients)
+    new_author = create_user(f'new-author-{size}')
+    for number in range(size):
+        create_recipe(
+            new_author, f'Рецепт {size}-new-{number}', tags, ingredients
+        )
+    Subscription.objects.bulk_create(
+        [Subscription(user=me, author=author) for author in authors]
+        + [Subscription(user=author, author=me) for author in authors]
+    )
+    for model in (Favorite, ShoppingCart):
+        model.objects.bulk_create(
+            [model(user=me, recipe=recipe) for recipe in recipes]
+            + [model(user=author, recipe=own) for author in authors]
+        )
+    for user in (me, *authors):
+        shopping_list.rebuild(user)
+    return SimpleNamespace(
+        size=size,
+        me=me,
+        authors=authors,
+        new_author=new_author,
+        tags=tags,
+        ingredients=ingredients,
+        recipes=recipes,
+        fresh=fresh,
+        own=own,
+    )
+
+
+@pytest.fixture
+def make_world(db):
+    return build_world
@@ -0,0 +1,6 @@
+"""Настройки тестов: SQLite, если база не задана явно через DB_ENGINE."""
+import os
+
+os.environ.setdefault('DB_ENGINE', 'django.db.backends.sqlite3')
+
+from foodgram.settings import *  # noqa: E402,F401,F403
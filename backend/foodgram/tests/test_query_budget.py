@@ -0,0 +1,251 @@
+"""Число SQL-запросов каждого маршрута api/urls.py не должно зависеть от
+объёма данных и не должно превышать бюджет.
+
+Каждый случай выполняется на данных двух размеров; при росте числа
+запросов тест показывает добавившиеся запросы и стек их вызова.
+"""
+import json
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import pytest
+from recipes.models import Favorite, Recipe, ShoppingCart
+from rest_framework.authtoken.models import Token
+from users.models import Subscription
+
+from .conftest import PASSWORD, User
+
+SIZES = (2, 6)
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+
+
+def recipe_body(world, name):
+    return {
+        'name': f'{name} {world.size}',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'image': IMAGE,
+        'tags': [tag.pk for tag in world.tags],
+        'ingredients': [
+            {'id': ingredient.pk, 'amount': 7}
+            for ingredient in world.ingredients
+        ],
+    }
+
+
+def payload(response):
+    return json.loads(response.body)
+
+
+def ids(response):
+    data = payload(response)
+    if isinstance(data, dict):
+        data = data['results']
+    return {item['id'] for item in data}
+
+
+def pks(objects):
+    return {obj.pk for obj in objects}
+
+
+def find(response, pk):
+    return next(
+        item for item in payload(response)['results'] if item['id'] == pk
+    )
+
+
+def batch_ok(world, response):
+    return all(
+        item['status'] == 'ok'
+        for items in payload(response).values()
+        for item in items
+    )
+
+
+@dataclass
+class Case:
+    name: str
+    method: str
+    url: Callable
+    budget: int
+    check: Callable
+    auth: bool = True
+    data: Optional[Callable] = None
+    prepare: Optional[Callable] = None
+
+    def __str__(self):
+        return self.name
+
+
+CASES = (
+    Case('tags_list', 'get', lambda w: '/api/tags/', 1,
+         lambda w, r: pks(w.tags) <= ids(r), auth=False),
+    Case('tag_detail', 'get', lambda w: f'/api/tags/{w.tags[0].pk}/', 1,
+         lambda w, r: payload(r)['slug'] == w.tags[0].slug, auth=False),
+    Case('ingredients_list', 'get', lambda w: '/api/ingredients/', 1,
+         lambda w, r: pks(w.ingredients) <= ids(r), auth=False),
+    Case('ingredients_search', 'get',
+         lambda w: '/api/ingredients/?name=продукт', 1,
+         lambda w, r: pks(w.ingredients) <= ids(r), auth=False),
+    Case('ingredient_detail', 'get',
+         lambda w: f'/api/ingredients/{w.ingredients[0].pk}/', 1,
+         lambda w, r: payload(r)['name'] == w.ingredients[0].name,
+         auth=False),
+    # Списки без фильтров на PostgreSQL делают ещё один запрос: оценку
+    # числа строк по статистике планировщика.
+    Case('recipes_list_anonymous', 'get', lambda w: '/api/recipes/?limit=100',
+         5, lambda w, r: w.own.pk in ids(r), auth=False),
+    Case('recipes_list', 'get', lambda w: '/api/recipes/?limit=100', 6,
+         lambda w, r: find(r, w.recipes[0].pk)['is_favorited']),
+    Case('recipes_list_cursor', 'get',
+         lambda w: '/api/recipes/?limit=100&cursor=', 4,
+         lambda w, r: w.own.pk in ids(r)),
+    Case('recipes_filtered', 'get',
+         lambda w: (
+             '/api/recipes/?limit=100&is_favorited=1&is_in_shopping_cart=1'
+             f'&tags={w.tags[0].slug}'
+         ), 6,
+         lambda w, r: ids(r) == pks(w.recipes)),
+    Case('recipes_by_author', 'get',
+         lambda w: f'/api/recipes/?limit=100&author={w.authors[0].pk}', 6,
+         lambda w, r: ids(r) == pks(w.authors[0].recipe.all())),
+    Case('recipes_search', 'get',
+         lambda w: '/api/recipes/?limit=100&search=Рецепт', 5,
+         lambda w, r: w.recipes[0].pk in ids(r)),
+    Case('recipe_detail', 'get', lambda w: f'/api/recipes/{w.own.pk}/', 4,
+         lambda w, r: len(payload(r)['ingredients']) == w.size),
+    # Сохранение изображения на PostgreSQL берёт advisory lock по имени
+    # файла.
+    Case('recipe_create', 'post', lambda w: '/api/recipes/', 16,
+         lambda w, r: payload(r)['name'] == f'Созданный {w.size}',
+         data=lambda w: recipe_body(w, 'Созданный')),
+    Case('recipe_update', 'patch', lambda w: f'/api/recipes/{w.own.pk}/', 25,
+         lambda w, r: payload(r)['name'] == f'Изменённый {w.size}',
+         data=lambda w: recipe_body(w, 'Изменённый')),
+    Case('recipe_delete', 'delete', lambda w: f'/api/recipes/{w.own.pk}/',
+         22, lambda w, r: not Recipe.objects.filter(pk=w.own.pk).exists()),
+    # Изменения избранного и корзины блокируют строку пользователя,
+    # изменения корзины и ингредиентов — ещё и строки рецептов;
+    # в транзакции теста atomic() добавляет ещё SAVEPOINT и RELEASE.
+    Case('favorite_add', 'post',
+         lambda w: f'/api/recipes/{w.fresh[0].pk}/favorite/', 8,
+         lambda w, r: Favorite.objects.filter(
+             user=w.me, recipe=w.fresh[0]
+         ).exists()),
+    Case('favorite_remove', 'delete',
+         lambda w: f'/api/recipes/{w.recipes[0].pk}/favorite/', 6,
+         lambda w, r: not Favorite.objects.filter(
+             user=w.me, recipe=w.recipes[0]
+         ).exists()),
+    Case('favorite_batch', 'post', lambda w: '/api/recipes/favorite/batch/',
+         8, batch_ok, data=lambda w: {
+             'add': [recipe.pk for recipe in w.fresh],
+             'remove': [recipe.pk for recipe in w.recipes[:w.size]],
+         }),
+    Case('shopping_cart_add', 'post',
+         lambda w: f'/api/recipes/{w.fresh[0].pk}/shopping_cart/', 17,
+         lambda w, r: ShoppingCart.objects.filter(
+             user=w.me, recipe=w.fresh[0]
+         ).exists()),
+    Case('shopping_cart_remove', 'delete',
+         lambda w: f'/api/recipes/{w.recipes[0].pk}/shopping_cart/', 14,
+         lambda w, r: not ShoppingCart.objects.filter(
+             user=w.me, recipe=w.recipes[0]
+         ).exists()),
+    Case('shopping_cart_batch', 'post',
+         lambda w: '/api/recipes/shopping_cart/batch/', 15, batch_ok,
+         data=lambda w: {
+             'add': [recipe.pk for recipe in w.fresh],
+         }),
+    Case('download_shopping_cart', 'get',
+         lambda w: '/api/recipes/download_shopping_cart/?format=txt', 2,
+         lambda w, r: (
+             f'{w.ingredients[0].name} (г) - {5 * len(w.recipes)}\n'
+             in r.body.decode()
+         )),
+    Case('users_list', 'get', lambda w: '/api/users/?limit=100', 4,
+         lambda w, r: pks(w.authors) <= ids(r)),
+    Case('user_detail', 'get', lambda w: f'/api/users/{w.authors[0].pk}/', 2,
+         lambda w, r: payload(r)['is_subscribed']),
+    Case('users_me', 'get', lambda w: '/api/users/me/', 0,
+         lambda w, r: payload(r)['username'] == w.me.username),
+    Case('subscriptions', 'get',
+         lambda w: '/api/users/subscriptions/?limit=100', 3,
+         lambda w, r: ids(r) == pks(w.authors)),
+    Case('subscribe', 'post',
+         lambda w: f'/api/users/{w.new_author.pk}/subscribe/', 7,
+         lambda w, r: payload(r)['id'] == w.new_author.pk),
+    Case('unsubscribe', 'delete',
+         lambda w: f'/api/users/{w.authors[0].pk}/subscribe/', 3,
+         lambda w, r: not Subscription.objects.filter(
+             user=w.me, author=w.authors[0]
+         ).exists()),
+    Case('register', 'post', lambda w: '/api/users/', 5,
+         lambda w, r: payload(r)['username'] == f'new-{w.size}',
+         auth=False, data=lambda w: {
+             'username': f'new-{w.size}',
+             'email': f'new-{w.size}@example.com',
+             'first_name': 'Имя',
+             'last_name': 'Фамилия',
+             'password': PASSWORD,
+         }),
+    Case('token_login', 'post', lambda w: '/api/auth/token/login/', 6,
+         lambda w, r: payload(r)['auth_token'],
+         auth=False, data=lambda w: {
+             'email': w.me.email, 'password': PASSWORD,
+         }),
+    Case('token_logout', 'post', lambda w: '/api/auth/token/logout/', 2,
+         lambda w, r: not Token.objects.filter(user=w.me).exists(),
+         prepare=lambda w: Token.objects.create(user=w.me)),
+    # Сохранение пользователя меняет версии карточек его рецептов.
+    Case('set_password', 'post', lambda w: '/api/users/set_password/', 2,
+         lambda w, r: User.objects.get(pk=w.me.pk).check_password(
+             f'{PASSWORD}-new'
+         ),
+         data=lambda w: {
+             'current_password': PASSWORD,
+             'new_password': f'{PASSWORD}-new',
+         }),
+    Case('metrics', 'get', lambda w: '/api/metrics', 0,
+         lambda w, r: (
+             b'# TYPE foodgram_http_request_duration_seconds histogram'
+             in r.body
+         ),
+         auth=False),
+)
+
+
+@pytest.mark.parametrize('case', CASES, ids=str)
+def test_query_budget(case, make_world, client_for, record_queries):
+    runs = []
+    for size in SIZES:
+        world = make_world(size)
+        client = client_for(world.me if case.auth else None)
+        if case.prepare:
+            case.prepare(world)
+        data = case.data(world) if case.data else None
+        response, queries = record_queries(
+            lambda: getattr(client, case.method)(
+                case.url(world), data, format='json'
+            )
+        )
+        assert response.status_code < 400, response.body
+        assert case.check(world, response), response.body
+        runs.append(queries)
+    small, large = runs
+    if len(large) != len(small):
+        pytest.fail(
+            f'{case}: {len(small)} запросов при размере {SIZES[0]}, '
+            f'{len(large)} при размере {SIZES[1]}. Добавились:\n'
+            + large.report(small),
+            pytrace=False,
+        )
+    if len(large) > case.budget:
+        pytest.fail(
+            f'{case}: {len(large)} запросов при бюджете {case.budget}:\n'
+            + large.report(),
+            pytrace=False,
+        )
@@ -1,6 +1,7 @@
+from django.apps import apps
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models import F, Q
+from django.db.models import Count, F, OuterRef, Prefetch, Q, Subquery
 
 
 class UserRoles:
@@ -65,6 +66,32 @@ class UserFoodgram(AbstractUser):
         return self.username
 
 
+class SubscriptionQuerySet(models.QuerySet):
+
+    def with_recipes(self, recipes_limit):
+        """Добавляет число рецептов автора и первые recipes_limit из них.
+
+        Рецепты каждого автора отбираются коррелированным подзапросом
+        с LIMIT, поэтому вся страница подписок загружается фиксированным
+        числом запросов.
+        """
+        recipe_model = apps.get_model('recipes', 'Recipe')
+        latest = recipe_model.objects.filter(
+            author=OuterRef('author')
+        ).order_by('-pub_date').values('pk')[:recipes_limit]
+        return self.select_related('author').annotate(
+            recipes_count=Count('author__recipe')
+        ).prefetch_related(
+            Prefetch(
+                'author__recipe',
+                queryset=recipe_model.objects.filter(
+                    pk__in=Subquery(latest)
+                ).order_by('-pub_date'),
+                to_attr='limited_recipes',
+            )
+        )
+
+
 class Subscription(models.Model):
     user = models.ForeignKey(
         UserFoodgram,
@@ -81,6 +108,8 @@ class Subscription(models.Model):
         null=True
     )
 
+    objects = SubscriptionQuerySet.as_manager()
+
     def email(self):
         return self.author.email
 